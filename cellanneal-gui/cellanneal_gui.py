@@ -1,10 +1,11 @@
 import tkinter as tk
 from PIL import Image, ImageTk
-from pandas import DataFrame, read_excel, read_csv
+from pandas import DataFrame
 from tkinter.filedialog import askopenfile, askdirectory
 from tkinter import messagebox
 from pathlib import Path
 from cellanneal import cellanneal_pipe
+from cellanneal.loader import import_data_file
 import openpyxl  # for xlsx import
 import xlrd  # for xls import
 import sys
@@ -303,7 +304,7 @@ class cellgui:
             readme_window,
             wraplength=wl,
             justify=tk.LEFT,
-            text="cellanneal accepts text files (*.csv and *.txt) as well as excel files (*.xlsx and *.xls) as inputs for both mixture and signature data provided that they are formatted as specified in the examples. \nSpecifically, gene names need to appear in the first column for both mixture and signature data files, and sample names (for mixture data file) or cell type names (for signature data file) need to appear in the first row.",
+            text="cellanneal accepts text files (*.csv and *.txt) excel files (*.xlsx and *.xls) and binary files (*.parquet, *.feather, *.npz and *.h5, see the documentation) as inputs for both mixture and signature data provided that they are formatted as specified in the examples. \nSpecifically, gene names need to appear in the first column for both mixture and signature data files, and sample names (for mixture data file) or cell type names (for signature data file) need to appear in the first row.",
         )
         self.readme_text4.grid(row=4, column=0, padx=10)
 
@@ -349,7 +350,10 @@ class cellgui:
             parent=root,
             mode="rb",
             title="Choose a mixture data file.",
-            filetypes=[("tabular data files", ".csv .txt .xlsx .xls")],
+            filetypes=[
+                ("tabular data files", ".csv .txt .xlsx .xls"),
+                ("binary data files", ".parquet .pq .feather .arrow .npz .h5 .hdf5"),
+            ],
         )
         if file:
             self.bulk_data_path.set(file.name)
@@ -360,7 +364,10 @@ class cellgui:
             parent=root,
             mode="rb",
             title="Choose a signature data file.",
-            filetypes=[("tabular data files", ".csv .txt .xlsx")],
+            filetypes=[
+                ("tabular data files", ".csv .txt .xlsx"),
+                ("binary data files", ".parquet .pq .feather .arrow .npz .h5 .hdf5"),
+            ],
         )
         if file:
             self.celltype_data_path.set(file.name)
@@ -614,25 +621,9 @@ class cellgui:
         # bulk data
         print("\n+++ Importing mixture data ... +++ \n")
         try:
-            bfile = self.bulk_data_path.get()
-            # depending on extension, use different import function
-            if bfile.split(".")[-1] in ["csv", "txt"]:
-                self.bulk_df = read_csv(bfile, index_col=0, sep=None)
-            elif bfile.split(".")[-1] in ["xlsx"]:
-                self.bulk_df = read_excel(bfile, index_col=0, engine="openpyxl")
-            elif bfile.split(".")[-1] in ["xls"]:
-                self.bulk_df = read_excel(bfile, index_col=0, engine="xlrd")
-            else:
-                raise ImportError
-            # here, in order to make further course case insensitive,
-            # change all gene names to uppercase only
-            self.bulk_df.index = self.bulk_df.index.str.upper()
-            # also, if there are duplicate genes, the are summed here
-            self.bulk_df = self.bulk_df.groupby(self.bulk_df.index).sum()
-            # finally, if there are nan's after import, set them to 0 to
-            # avoid further issues
-            self.bulk_df = self.bulk_df.fillna(0)
-
+            self.bulk_df = import_data_file(
+                Path(self.bulk_data_path.get()), use_cache=True
+            )
         except:
             messagebox.showerror(
                 "Import error",
@@ -644,25 +635,9 @@ class cellgui:
         # celltype data
         print("\n+++ Importing signature data ... +++ \n")
         try:
-            # depending on extension, use different import function
-            cfile = self.celltype_data_path.get()
-            if cfile.split(".")[-1] in ["csv", "txt"]:
-                self.celltype_df = read_csv(cfile, index_col=0, sep=None)
-            elif cfile.split(".")[-1] in ["xlsx"]:
-                self.celltype_df = read_excel(cfile, index_col=0, engine="openpyxl")
-            elif cfile.split(".")[-1] in ["xls"]:
-                self.celltype_df = read_excel(cfile, index_col=0, engine="xlrd")
-            else:
-                raise ImportError
-            # here, in order to make further course case insensitive,
-            # change all gene names to uppercase only
-            self.celltype_df.index = self.celltype_df.index.str.upper()
-            # also, if there are duplicate genes, the are summed here
-            self.celltype_df = self.celltype_df.groupby(self.celltype_df.index).sum()
-            # finally, if there are nan's after import, set them to 0 to
-            # avoid further issues
-            self.celltype_df = self.celltype_df.fillna(0)
-
+            self.celltype_df = import_data_file(
+                Path(self.celltype_data_path.get()), use_cache=True
+            )
         except:
             messagebox.showerror(
                 "Import error",
@@ -7,3 +7,5 @@ __author__ = "Lisa Buchauer <lisa.buchauer@posteo.de>"
 from .general import make_gene_dictionary, return_mixture, deconvolve
 from .plots import plot_pies, plot_mix_heatmap, plot_mix_heatmap_log, plot_scatter
 from .pipelines import cellanneal_pipe, run_cellanneal
+from .alignment import GeneAlignment
+from .result import DeconvolutionResult
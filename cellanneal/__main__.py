@@ -5,12 +5,50 @@ production of a set of plots."""
 
 import argparse
 from pathlib import Path
-from pandas import read_csv, read_excel
+import sys
 import time
 import openpyxl  # for xlsx import
 import xlrd  # for xls import
 
+from .loader import ChunkedDataFile, import_data_file
 from .pipelines import cellanneal_pipe
+from .signature_index import (
+    compile_signature_index,
+    is_signature_index,
+    load_signature_index,
+)
+
+
+def positive_int(value):
+    """Argument type of integers of at least one."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("{} is not at least 1".format(value))
+    return number
+
+
+def non_negative_int(value):
+    """Argument type of integers of at least zero."""
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError("{} is negative".format(value))
+    return number
+
+
+def non_negative_float(value):
+    """Argument type of floats of at least zero."""
+    number = float(value)
+    if not number >= 0:
+        raise argparse.ArgumentTypeError("{} is negative".format(value))
+    return number
+
+
+def positive_float(value):
+    """Argument type of floats larger than zero."""
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError("{} is not positive".format(value))
+    return number
 
 
 def init_parser(parser):
@@ -19,7 +57,8 @@ def init_parser(parser):
         "bulk_data_path",
         type=str,
         help=(
-            """Path to mixture data file; .csv, .txt, .xlsx or .xls format
+            """Path to mixture data file; .csv, .txt, .xlsx, .xls,
+        .parquet, .feather, .npz or .h5 format
         with sample names as columns and genes as rows."""
         ),
     )
@@ -28,8 +67,10 @@ def init_parser(parser):
         "celltype_data_path",
         type=str,
         help=(
-            """Path to signature data file; .csv, .txt, .xlsx or .xls format
-        with sample names as columns and genes as rows."""
+            """Path to signature data file; .csv, .txt, .xlsx, .xls,
+        .parquet, .feather, .npz or .h5 format
+        with sample names as columns and genes as rows, or to a signature
+        index created with "cellanneal index"."""
         ),
     )
 
@@ -76,9 +117,239 @@ def init_parser(parser):
         help=("""Maximum number of iterations for scipy's dual_annealing."""),
     )
 
+    parser.add_argument(
+        "--n_jobs",
+        type=int,
+        default=1,
+        help=(
+            """Number of processes across which mixture samples are
+            distributed; -1 uses all available cores."""
+        ),
+    )
+
+    parser.add_argument(
+        "--warm_start",
+        type=str,
+        choices=["nnls"],
+        default=None,
+        help=(
+            """Start annealing from a non-negative least squares fit of
+            each mixture instead of a random point."""
+        ),
+    )
+
+    parser.add_argument(
+        "--compare_warm_start",
+        action="store_true",
+        help=(
+            """Additionally anneal from a random point and report the
+            number of iterations saved by the warm start."""
+        ),
+    )
+
+    parser.add_argument(
+        "--patience",
+        type=positive_int,
+        default=None,
+        help=(
+            """Stop annealing a mixture early once its best distance has
+            improved by no more than the tolerance over this many
+            iterations."""
+        ),
+    )
+
+    parser.add_argument(
+        "--atol",
+        type=non_negative_float,
+        default=0.0,
+        help=("Absolute distance tolerance for early stopping."),
+    )
+
+    parser.add_argument(
+        "--rtol",
+        type=non_negative_float,
+        default=0.0,
+        help=("Relative distance tolerance for early stopping."),
+    )
+
+    parser.add_argument(
+        "--time_limit",
+        type=positive_float,
+        default=None,
+        help=(
+            """Wall clock time limit in seconds for each mixture, after
+            which the best mixture found so far is returned."""
+        ),
+    )
+
+    parser.add_argument(
+        "--run_time_limit",
+        type=positive_float,
+        default=None,
+        help=(
+            """Wall clock time limit in seconds for all mixtures together,
+            split evenly among the mixtures not yet started."""
+        ),
+    )
+
+    parser.add_argument(
+        "--n_chains",
+        type=positive_int,
+        default=1,
+        help=(
+            """Number of parallel tempering chains at different temperatures
+            annealing each mixture at the same time, run in threads. The
+            chains share the maxiter iterations of a mixture."""
+        ),
+    )
+
+    parser.add_argument(
+        "--simplex",
+        action="store_true",
+        help=(
+            """Search the mixture in K - 1 stick breaking parameters instead
+            of K cell type weights of arbitrary scale."""
+        ),
+    )
+
+    parser.add_argument(
+        "--cache_size",
+        type=non_negative_int,
+        default=0,
+        help=(
+            """Number of objective values per mixture kept in a cache, so
+            that locations visited again are looked up (default: 0, no
+            cache)."""
+        ),
+    )
+
+    parser.add_argument(
+        "--chunk_size",
+        type=positive_int,
+        default=None,
+        help=(
+            """Read and deconvolve the mixture data this many samples at a
+            time, to keep memory bounded for data sets with many samples."""
+        ),
+    )
+
+    parser.add_argument(
+        "--resume",
+        type=str,
+        default=None,
+        metavar="RUN_FOLDER",
+        help=(
+            """Resume the interrupted run whose results are in RUN_FOLDER,
+            deconvolving only the samples it has not finished. The run has
+            to be started with the same data and parameters as before."""
+        ),
+    )
+
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help=(
+            """Always parse the data files instead of reusing imports cached
+            from earlier runs in the cellanneal cache folder (set by the
+            environment variable CELLANNEAL_CACHE_DIR, default:
+            ~/.cache/cellanneal)."""
+        ),
+    )
+
+    parser.add_argument(
+        "--dtype",
+        type=str,
+        choices=["float64", "float32"],
+        default="float64",
+        help=(
+            """Floating point precision in which the data is imported and
+            kept; float32 halves the memory needed for the data, while the
+            objective is still evaluated in double precision (default:
+            float64)."""
+        ),
+    )
+
+    parser.add_argument(
+        "--genewise_format",
+        type=str,
+        choices=["csv", "parquet", "npz"],
+        default="csv",
+        help=(
+            """Write the genewise comparison of mixture and mixed expression
+            to one csv file per mixture (default), or to a single compressed
+            long-format parquet or npz file for all mixtures (npz is not
+            available with --chunk_size)."""
+        ),
+    )
+
+    return parser
+
+
+def init_index_parser(parser):
+    """Initialize parser arguments of the index command."""
+    parser.add_argument(
+        "celltype_data_path",
+        type=str,
+        help=(
+            """Path to signature data file; .csv, .txt, .xlsx, .xls,
+        .parquet, .feather, .npz or .h5 format
+        with cell type names as columns and genes as rows."""
+        ),
+    )
+
+    parser.add_argument(
+        "index_path",
+        type=str,
+        help=(
+            """Path of the directory in which to store the signature index.
+            It can then be used in place of the signature data file."""
+        ),
+    )
+
     return parser
 
 
+def index_main(argv):
+    """cellanneal index. Precompiles a signature data file into a signature
+    index, which later runs load in place of the signature data file without
+    importing it again or recomputing gene dispersions.
+
+    Example:
+            cellanneal index signature.csv signature_index
+    """
+    my_parser = argparse.ArgumentParser(
+        prog="cellanneal index",
+        description=("cellanneal index compiles signature data for reuse."),
+    )
+    args = init_index_parser(my_parser).parse_args(argv)
+    celltype_data_path = Path(args.celltype_data_path)
+    index_path = Path(args.index_path)
+
+    print("\n+++ Importing signature data ... +++ \n")
+    try:
+        celltype_df = import_data_file(celltype_data_path)
+    except ValueError:
+        print(
+            """Your celltype data file could not be imported.
+        Please check the documentation for format requirements
+        and look at the example celltype data files."""
+        )
+        print("+++ Aborted. +++")
+        return 0
+
+    print("\n+++ Compiling signature index ... +++ \n")
+    signature_index = compile_signature_index(celltype_df, index_path)
+    print(
+        "Stored {} genes and {} cell types in {} (sha256 {}).".format(
+            len(signature_index.genes),
+            len(signature_index.celltypes),
+            index_path,
+            signature_index.content_hash,
+        )
+    )
+    print("\n+++ Finished. +++\n")
+
+
 def main():
     """cellanneal. User-friendly deconvolution of RNA-Seq mixture data.
 
@@ -95,6 +366,22 @@ def main():
             bulk_max
             disp_min
             maxiter
+            n_jobs
+            warm_start
+            compare_warm_start
+            patience
+            atol
+            rtol
+            time_limit
+            run_time_limit
+            n_chains
+            simplex
+            cache_size
+            chunk_size
+            resume
+            no_cache
+            dtype
+            genewise_format
 
     Output:
 
@@ -102,6 +389,10 @@ def main():
 
 
     """
+    # "cellanneal index ..." compiles a signature index instead
+    if len(sys.argv) > 1 and sys.argv[1] == "index":
+        return index_main(sys.argv[2:])
+
     # get a parser object, initialise the inputs and read them into args
     my_parser = argparse.ArgumentParser(
         description=("cellanneal deconvolves bulk RNA-Seq data.")
@@ -116,6 +407,22 @@ def main():
     bulk_max = args.bulk_max
     disp_min = args.disp_min
     maxiter = args.maxiter
+    n_jobs = args.n_jobs
+    warm_start = args.warm_start
+    compare_warm_start = args.compare_warm_start
+    patience = args.patience
+    atol = args.atol
+    rtol = args.rtol
+    time_limit = args.time_limit
+    run_time_limit = args.run_time_limit
+    n_chains = args.n_chains
+    simplex = args.simplex
+    cache_size = args.cache_size
+    chunk_size = args.chunk_size
+    resume_path = Path(args.resume) if args.resume is not None else None
+    use_cache = not args.no_cache
+    dtype = args.dtype
+    genewise_format = args.genewise_format
 
     print("\n+++ Welcome to cellanneal! +++")
     print("{}\n".format(time.ctime()))
@@ -123,24 +430,11 @@ def main():
     """ 1) Import bulk and cell type data """
     print("\n+++ Importing mixture data ... +++ \n")
     try:
-        bfile = bulk_data_path
-        # depending on extension, use different import function
-        if bfile.name.split(".")[-1] in ["csv", "txt"]:
-            bulk_df = read_csv(bfile, index_col=0, sep=None)
-        elif bfile.name.split(".")[-1] in ["xlsx"]:
-            bulk_df = read_excel(bfile, index_col=0, engine="openpyxl")
-        elif bfile.name.split(".")[-1] in ["xls"]:
-            bulk_df = read_excel(bfile, index_col=0, engine="xlrd")
+        if chunk_size is None:
+            bulk_df = import_data_file(bulk_data_path, dtype=dtype, use_cache=use_cache)
         else:
-            raise ImportError
-        # here, in order to make further course case insensitive,
-        # change all gene names to uppercase only
-        bulk_df.index = bulk_df.index.str.upper()
-        # also, if there are duplicate genes, the are summed here
-        bulk_df = bulk_df.groupby(bulk_df.index).sum()
-        # finally, if there are nan's after import, set them to 0 to
-        # avoid further issues
-        bulk_df = bulk_df.fillna(0)
+            # only the header is read here, samples follow chunk by chunk
+            bulk_df = ChunkedDataFile(bulk_data_path, chunk_size, dtype=dtype)
     except ValueError:
         print(
             """Your bulk data file could not be imported.
@@ -151,26 +445,18 @@ def main():
         return 0
 
     print("\n+++ Importing signature data ... +++ \n")
-    # import single cell based reference
+    # import single cell based reference, either from a data file or from a
+    # signature index compiled with "cellanneal index"
+    dispersion_norm = None
     try:
-        # depending on extension, use different import function
-        cfile = celltype_data_path
-        if cfile.name.split(".")[-1] in ["csv", "txt"]:
-            celltype_df = read_csv(cfile, index_col=0, sep=None)
-        elif cfile.name.split(".")[-1] in ["xlsx"]:
-            celltype_df = read_excel(cfile, index_col=0, engine="openpyxl")
-        elif cfile.name.split(".")[-1] in ["xls"]:
-            celltype_df = read_excel(cfile, index_col=0, engine="xlrd")
+        if is_signature_index(celltype_data_path):
+            signature_index = load_signature_index(celltype_data_path)
+            celltype_df = signature_index.to_dataframe()
+            dispersion_norm = signature_index.dispersion_norm
         else:
-            raise ImportError
-        # here, in order to make further course case insensitive,
-        # change all gene names to uppercase only
-        celltype_df.index = celltype_df.index.str.upper()
-        # also, if there are duplicate genes, the are summed here
-        celltype_df = celltype_df.groupby(celltype_df.index).sum()
-        # finally, if there are nan's after import, set them to 0 to
-        # avoid further issues
-        celltype_df = celltype_df.fillna(0)
+            celltype_df = import_data_file(
+                celltype_data_path, dtype=dtype, use_cache=use_cache
+            )
     except ValueError:
         print(
             """Your celltype data file could not be imported.
@@ -191,4 +477,19 @@ def main():
         bulk_max,
         maxiter,
         output_path,
+        n_jobs=n_jobs,
+        dispersion_norm=dispersion_norm,
+        warm_start=warm_start,
+        compare_warm_start=compare_warm_start,
+        patience=patience,
+        atol=atol,
+        rtol=rtol,
+        time_limit=time_limit,
+        run_time_limit=run_time_limit,
+        n_chains=n_chains,
+        simplex=simplex,
+        cache_size=cache_size,
+        resume_path=resume_path,
+        dtype=dtype,
+        genewise_format=genewise_format,
     )
@@ -0,0 +1,91 @@
+import numpy as np
+
+
+class GeneAlignment(object):
+    """Aligns mixture and signature data on their common genes once, such that
+    all later steps can work on plain numpy arrays indexed by integer gene
+    positions instead of repeated label-based pandas lookups.
+
+    Parameters
+    ----------
+    celltype_df : DataFrame
+        Signature data with genes as rows and cell types as columns.
+    bulk_df : DataFrame
+        Mixture data with genes as rows and samples as columns.
+    gene_dict : dict
+        Gene list for each mixture sample as returned by
+        `make_gene_dictionary`.
+    dtype : dtype, optional
+        Floating point type in which signature and mixture data are stored,
+        float64 by default. With float32 they take half the memory.
+
+    Attributes
+    ----------
+    genes : ndarray
+        Names of the genes present in both data sets.
+    celltypes : list
+        Cell type names in signature column order.
+    samples : list
+        Mixture sample names, alphabetically sorted.
+    sample_rows : dict
+        Row of each sample in `bulk`.
+    signature : ndarray, shape (n_genes, n_celltypes)
+        Signature data of the common genes.
+    bulk : ndarray, shape (n_samples, n_genes)
+        Mixture data of the common genes, one row per sample.
+    positions : dict
+        For each sample, the positions of its genes in `genes` as an int32
+        array, in the order of the sample's gene list. Samples with identical
+        gene sets share the same array.
+    gene_sets : list
+        The distinct position arrays, in order of first occurrence.
+    gene_set_samples : list
+        For each entry of `gene_sets`, the samples using it.
+    """
+
+    def __init__(self, celltype_df, bulk_df, gene_dict, dtype=float):
+        # order bulk columns alphabetically, as throughout cellanneal
+        bulk_df = bulk_df.sort_index(axis=1)
+        common = celltype_df.index.intersection(bulk_df.index)
+        self.genes = common.values
+        self.celltypes = celltype_df.columns.tolist()
+        self.samples = bulk_df.columns.tolist()
+        self.sample_rows = {sample: i for i, sample in enumerate(self.samples)}
+        self.signature = np.ascontiguousarray(
+            celltype_df.reindex(common).values, dtype=dtype
+        )
+        self.bulk = np.ascontiguousarray(bulk_df.reindex(common).values.T, dtype=dtype)
+
+        # map gene names to positions once and keep only integer positions,
+        # storing identical gene sets only once as identified by their bytes
+        self.positions = {}
+        self.gene_sets = []
+        self.gene_set_samples = []
+        set_index = {}
+        for sample in self.samples:
+            positions = common.get_indexer(gene_dict[sample])
+            if np.any(positions < 0):
+                raise KeyError(
+                    "Genes for sample {} are missing in mixture or signature "
+                    "data.".format(sample)
+                )
+            positions = positions.astype(np.int32)
+            fingerprint = positions.tobytes()
+            if fingerprint not in set_index:
+                set_index[fingerprint] = len(self.gene_sets)
+                self.gene_sets.append(positions)
+                self.gene_set_samples.append([])
+            self.positions[sample] = self.gene_sets[set_index[fingerprint]]
+            self.gene_set_samples[set_index[fingerprint]].append(sample)
+
+    def sample_genes(self, sample):
+        """Names of the genes used for sample."""
+        return self.genes[self.positions[sample]]
+
+    def sample_bulk(self, sample):
+        """Mixture expression of sample, subset to its genes."""
+        return self.bulk[self.sample_rows[sample], self.positions[sample]]
+
+    def sample_signature(self, sample):
+        """Signature data subset to the genes of sample."""
+        return self.signature[self.positions[sample]]
@@ -16,6 +16,11 @@ A Dual Annealing global optimization algorithm
 
 from __future__ import division, print_function, absolute_import
 
+import copy
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 from scipy.optimize import OptimizeResult
 from scipy.optimize import minimize
@@ -31,7 +36,10 @@ class VisitingDistribution(object):
     Class used to generate new coordinates based on the distorted
     Cauchy-Lorentz distribution. Depending on the steps within the strategy
     chain, the class implements the strategy for generating new location
-    changes.
+    changes. All random variates needed by one run of the strategy chain are
+    drawn at once by `draw_block` and consumed by step from then on. The
+    generated location is written to a buffer which is reused by the next
+    call of `visiting`.
     Parameters
     ----------
     lb : array_like
@@ -87,34 +95,60 @@ class VisitingDistribution(object):
             / np.exp(gammaln(self._d1))
         )
 
+        # buffer for the generated locations
+        self._x_visit = np.empty(len(lb))
+        # random variates of the current strategy chain run, see draw_block
+        self._block_temperature = None
+        self._visits = None
+        self._tail_samples = None
+        self.accept_samples = None
+
+    def draw_block(self, temperature, dim):
+        """Draws the random variates for the 2 * dim steps of a strategy chain
+        run at the given temperature with a single call per distribution: the
+        visiting values of the dim steps changing all coordinates followed by
+        those of the dim steps changing one coordinate, the uniform samples
+        replacing values beyond the tail limit, and one acceptance uniform
+        per step."""
+        self._block_temperature = temperature
+        self._visits = self.visit_fn(temperature, dim * (dim + 1))
+        self._tail_samples = self.rand_state.random_sample((2 * dim, 2))
+        self.accept_samples = self.rand_state.random_sample(2 * dim)
+
     def visiting(self, x, step, temperature):
         """Based on the step in the strategy chain, new coordinated are
         generated by changing all components is the same time or only
-        one of them, the new values are computed with visit_fn method
+        one of them, the new values are taken from the block of visiting
+        values drawn for this temperature
         """
         dim = x.size
+        if temperature != self._block_temperature:
+            self.draw_block(temperature, dim)
+        x_visit = self._x_visit
         if step < dim:
-            # Changing all coordinates with a new visiting value
-            visits = self.visit_fn(temperature, dim)
-            upper_sample = self.rand_state.random_sample()
-            lower_sample = self.rand_state.random_sample()
-            visits[visits > self.TAIL_LIMIT] = self.TAIL_LIMIT * upper_sample
-            visits[visits < -self.TAIL_LIMIT] = -self.TAIL_LIMIT * lower_sample
-            x_visit = visits + x
-            a = x_visit - self.lower
-            b = np.fmod(a, self.bound_range) + self.bound_range
-            x_visit = np.fmod(b, self.bound_range) + self.lower
+            # Changing all coordinates with a new visiting value, wrapped
+            # into the bounds in place
+            x_visit[:] = self._visits[step * dim : (step + 1) * dim]
+            upper_sample, lower_sample = self._tail_samples[step]
+            x_visit[x_visit > self.TAIL_LIMIT] = self.TAIL_LIMIT * upper_sample
+            x_visit[x_visit < -self.TAIL_LIMIT] = -self.TAIL_LIMIT * lower_sample
+            x_visit += x
+            x_visit -= self.lower
+            np.fmod(x_visit, self.bound_range, out=x_visit)
+            x_visit += self.bound_range
+            np.fmod(x_visit, self.bound_range, out=x_visit)
+            x_visit += self.lower
             x_visit[np.fabs(x_visit - self.lower) < self.MIN_VISIT_BOUND] += 1.0e-10
         else:
             # Changing only one coordinate at a time based on strategy
             # chain step
-            x_visit = np.copy(x)
-            visit = self.visit_fn(temperature, 1)
+            x_visit[:] = x
+            index = step - dim
+            visit = self._visits[dim * dim + index]
             if visit > self.TAIL_LIMIT:
-                visit = self.TAIL_LIMIT * self.rand_state.random_sample()
+                visit = self.TAIL_LIMIT * self._tail_samples[step, 0]
             elif visit < -self.TAIL_LIMIT:
-                visit = -self.TAIL_LIMIT * self.rand_state.random_sample()
-            index = step - dim
+                visit = -self.TAIL_LIMIT * self._tail_samples[step, 1]
             x_visit[index] = visit + x[index]
             a = x_visit[index] - self.lower[index]
             b = np.fmod(a, self.bound_range[index]) + self.bound_range[index]
@@ -163,10 +197,24 @@ class EnergyState(object):
         A callback function which will be called for all minima found.
         ``x`` and ``f`` are the coordinates and function value of the
         latest minimum found, and `context` has value in [0, 1, 2]
+    Locations passed to `update_best` and `update_current` are copied into
+    buffers allocated once, so that callers may reuse their arrays.
     """
 
+    __slots__ = (
+        "ebest",
+        "current_energy",
+        "current_location",
+        "xbest",
+        "lower",
+        "upper",
+        "callback",
+    )
+
     # Maximimum number of trials for generating a valid starting point
     MAX_REINIT_COUNT = 1000
+    # Number of new starting points drawn at once for batched objectives
+    REINIT_BATCH_SIZE = 16
 
     def __init__(self, lower, upper, callback=None):
         self.ebest = None
@@ -182,14 +230,21 @@ class EnergyState(object):
         Initialize current location is the search domain. If `x0` is not
         provided, a random location within the bounds is generated.
         """
+        if self.current_location is None:
+            self.current_location = np.empty(len(self.lower))
         if x0 is None:
-            self.current_location = self.lower + rand_state.random_sample(
+            self.current_location[:] = self.lower + rand_state.random_sample(
                 len(self.lower)
             ) * (self.upper - self.lower)
         else:
-            self.current_location = np.copy(x0)
+            self.current_location[:] = x0
         init_error = True
         reinit_counter = 0
+        message = (
+            "Stopping algorithm because function "
+            "create NaN or (+/-) infinity values even with "
+            "trying new random parameters"
+        )
         while init_error:
             self.current_energy = func_wrapper.fun(self.current_location)
             if self.current_energy is None:
@@ -197,16 +252,20 @@ class EnergyState(object):
             if not np.isfinite(self.current_energy) or np.isnan(self.current_energy):
                 if reinit_counter >= EnergyState.MAX_REINIT_COUNT:
                     init_error = False
-                    message = (
-                        "Stopping algorithm because function "
-                        "create NaN or (+/-) infinity values even with "
-                        "trying new random parameters"
-                    )
                     raise ValueError(message)
-                self.current_location = self.lower + rand_state.random_sample(
-                    self.lower.size
-                ) * (self.upper - self.lower)
-                reinit_counter += 1
+                if func_wrapper.batch is not None:
+                    # draw and score blocks of new random locations at once
+                    # until one of them has a finite energy
+                    while not np.isfinite(self.current_energy):
+                        if reinit_counter >= EnergyState.MAX_REINIT_COUNT:
+                            raise ValueError(message)
+                        reinit_counter += self.redraw_batched(func_wrapper, rand_state)
+                    init_error = False
+                else:
+                    self.current_location[:] = self.lower + rand_state.random_sample(
+                        self.lower.size
+                    ) * (self.upper - self.lower)
+                    reinit_counter += 1
             else:
                 init_error = False
             # If first time reset, initialize ebest and xbest
@@ -215,9 +274,25 @@ class EnergyState(object):
                 self.xbest = np.copy(self.current_location)
             # Otherwise, we keep them in case of reannealing reset
 
+    def redraw_batched(self, func_wrapper, rand_state):
+        """
+        Draws a block of random locations, scores them with a single batched
+        objective call and moves to the first one with a finite energy, if
+        any. Returns the number of locations drawn.
+        """
+        locations = self.lower + rand_state.random_sample(
+            (self.REINIT_BATCH_SIZE, self.lower.size)
+        ) * (self.upper - self.lower)
+        energies = func_wrapper.fun_batch(locations)
+        valid = np.flatnonzero(np.isfinite(energies))
+        if valid.size > 0:
+            self.current_location[:] = locations[valid[0]]
+            self.current_energy = energies[valid[0]]
+        return len(locations)
+
     def update_best(self, e, x, context):
         self.ebest = e
-        self.xbest = np.copy(x)
+        self.xbest[:] = x
         if self.callback is not None:
             val = self.callback(x, e, context)
             if val is not None:
@@ -228,7 +303,18 @@ class EnergyState(object):
 
     def update_current(self, e, x):
         self.current_energy = e
-        self.current_location = np.copy(x)
+        self.current_location[:] = x
+
+
+def acceptance_probability(delta_e, temperature_step, acceptance_param):
+    """Probability with which a strategy chain at the artificial temperature
+    `temperature_step` accepts a location whose energy differs from that of
+    its current location by `delta_e`, for acceptance parameter
+    `acceptance_param`."""
+    pqv_temp = (acceptance_param - 1.0) * delta_e / (temperature_step + 1.0)
+    if pqv_temp <= 0.0:
+        return 0.0
+    return np.exp(np.log(pqv_temp) / (1.0 - acceptance_param))
 
 
 class StrategyChain(object):
@@ -255,6 +341,24 @@ class StrategyChain(object):
         Instance of `EnergyState` class.
     """
 
+    __slots__ = (
+        "emin",
+        "xmin",
+        "energy_state",
+        "acceptance_param",
+        "visit_dist",
+        "func_wrapper",
+        "minimizer_wrapper",
+        "not_improved_idx",
+        "not_improved_max_idx",
+        "_rand_state",
+        "temperature_step",
+        "K",
+        "deadline",
+        "time_limit_reached",
+        "energy_state_improved",
+    )
+
     def __init__(
         self,
         acceptance_param,
@@ -282,32 +386,34 @@ class StrategyChain(object):
         self._rand_state = rand_state
         self.temperature_step = 0
         self.K = 100 * len(energy_state.current_location)
+        # Wall clock time (time.monotonic) after which to stop, if any
+        self.deadline = None
+        self.time_limit_reached = False
+        self.energy_state_improved = False
 
     def accept_reject(self, j, e, x_visit):
-        r = self._rand_state.random_sample()
-        pqv_temp = (
-            (self.acceptance_param - 1.0)
-            * (e - self.energy_state.current_energy)
-            / (self.temperature_step + 1.0)
+        r = self.visit_dist.accept_samples[j]
+        pqv = acceptance_probability(
+            e - self.energy_state.current_energy,
+            self.temperature_step,
+            self.acceptance_param,
         )
-        if pqv_temp <= 0.0:
-            pqv = 0.0
-        else:
-            pqv = np.exp(np.log(pqv_temp) / (1.0 - self.acceptance_param))
         if r <= pqv:
             # We accept the new location and update state
             self.energy_state.update_current(e, x_visit)
-            self.xmin = np.copy(self.energy_state.current_location)
+            self.xmin[:] = self.energy_state.current_location
 
         # No improvement for a long time
         if self.not_improved_idx >= self.not_improved_max_idx:
             if j == 0 or self.energy_state.current_energy < self.emin:
                 self.emin = self.energy_state.current_energy
-                self.xmin = np.copy(self.energy_state.current_location)
+                self.xmin[:] = self.energy_state.current_location
 
     def run(self, step, temperature):
         self.temperature_step = temperature / float(step + 1)
         self.not_improved_idx += 1
+        # random variates for all steps of this run
+        self.visit_dist.draw_block(temperature, self.energy_state.current_location.size)
         for j in range(self.energy_state.current_location.size * 2):
             if j == 0:
                 if step == 0:
@@ -317,8 +423,16 @@ class StrategyChain(object):
             x_visit = self.visit_dist.visiting(
                 self.energy_state.current_location, j, temperature
             )
-            # Calling the objective function
-            e = self.func_wrapper.fun(x_visit)
+            # Calling the objective function, for single coordinate moves
+            # the objective may update its previous value incrementally
+            if j < self.energy_state.current_location.size:
+                e = self.func_wrapper.fun(x_visit)
+            else:
+                e = self.func_wrapper.fun_coordinate(
+                    x_visit,
+                    j - self.energy_state.current_location.size,
+                    self.energy_state.current_location,
+                )
             if e < self.energy_state.current_energy:
                 # We have got a better energy value
                 self.energy_state.update_current(e, x_visit)
@@ -334,8 +448,24 @@ class StrategyChain(object):
                 self.accept_reject(j, e, x_visit)
             if self.func_wrapper.nfev >= self.func_wrapper.maxfun:
                 return "Maximum number of function call reached " "during annealing"
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                self.time_limit_reached = True
+                return "Time limit reached during annealing"
         # End of StrategyChain loop
 
+    def iterate(self, step, temperature, no_local_search=False):
+        """Runs the strategy chain followed by a possible local search, which
+        makes up one iteration of dual annealing. Returns a message if the
+        search has to stop and None otherwise."""
+        val = self.run(step, temperature)
+        if val is not None:
+            return val
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.time_limit_reached = True
+            return "Time limit reached"
+        if not no_local_search:
+            return self.local_search()
+
     def local_search(self):
         # Decision making for performing a local search
         # based on strategy chain results
@@ -371,7 +501,7 @@ class StrategyChain(object):
             do_ls = True
         if do_ls:
             e, x = self.minimizer_wrapper.local_search(self.xmin, self.emin)
-            self.xmin = np.copy(x)
+            self.xmin[:] = x
             self.emin = e
             self.not_improved_idx = 0
             self.not_improved_max_idx = self.energy_state.current_location.size
@@ -388,9 +518,13 @@ class StrategyChain(object):
 
 
 class ObjectiveFunWrapper(object):
-    def __init__(self, func, maxfun=1e7, *args):
+    def __init__(self, func, maxfun=1e7, *args, cache_size=0):
         self.func = func
         self.args = args
+        # Objectives may provide a cheaper update for single coordinate moves
+        self.coordinate_move = getattr(func, "coordinate_move", None)
+        # ... and a vectorised evaluation of several locations at once
+        self.batch = getattr(func, "batch", None)
         # Number of objective function evaluations
         self.nfev = 0
         # Number of gradient function evaluation if used
@@ -398,10 +532,102 @@ class ObjectiveFunWrapper(object):
         # Number of hessian of the objective function if used
         self.nhev = 0
         self.maxfun = maxfun
+        # Optional LRU cache of function values keyed on the exact bytes of
+        # the location. Evaluations answered from it still count in nfev,
+        # cache_misses is the number of actual objective calls
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _cache_key(self, x):
+        return np.ascontiguousarray(x, dtype=float).tobytes()
+
+    def _cache_get(self, key):
+        e = self.cache.get(key)
+        if e is None:
+            self.cache_misses += 1
+        else:
+            self.cache_hits += 1
+            self.cache.move_to_end(key)
+        return e
+
+    def _cache_put(self, key, e):
+        self.cache[key] = e
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
 
     def fun(self, x):
         self.nfev += 1
-        return self.func(x, *self.args)
+        if not self.cache_size:
+            return self.func(x, *self.args)
+        key = self._cache_key(x)
+        e = self._cache_get(key)
+        if e is None:
+            e = self.func(x, *self.args)
+            self._cache_put(key, e)
+        return e
+
+    def fun_coordinate(self, x, index, x_base):
+        """Evaluates `x`, which differs from `x_base` only in component
+        `index`. Objectives with a ``coordinate_move(x, index, x_base, *args)``
+        method are updated incrementally, all others evaluated from scratch."""
+        if self.coordinate_move is None:
+            return self.fun(x)
+        self.nfev += 1
+        if not self.cache_size:
+            return self.coordinate_move(x, index, x_base, *self.args)
+        key = self._cache_key(x)
+        e = self._cache_get(key)
+        if e is None:
+            e = self.coordinate_move(x, index, x_base, *self.args)
+            self._cache_put(key, e)
+        return e
+
+    def fun_batch(self, xs):
+        """Evaluates each row of the 2-D array `xs`. Objectives with a
+        ``batch(xs, *args)`` method score all rows in a single call. With a
+        cache, only the rows not found in it are evaluated."""
+        self.nfev += len(xs)
+        if not self.cache_size:
+            return self._eval_batch(xs)
+        keys = [self._cache_key(x) for x in xs]
+        es = np.empty(len(xs))
+        missing = []
+        for b, key in enumerate(keys):
+            e = self._cache_get(key)
+            if e is None:
+                missing.append(b)
+            else:
+                es[b] = e
+        if missing:
+            es[missing] = self._eval_batch(xs[missing])
+            for b in missing:
+                self._cache_put(keys[b], es[b])
+        return es
+
+    def _eval_batch(self, xs):
+        if self.batch is None:
+            return np.array([self.func(x, *self.args) for x in xs])
+        return np.asarray(self.batch(xs, *self.args))
+
+    def fun_and_grad(self, x, epsilon=1e-8, lower=None, upper=None):
+        """Returns the function value at `x` and its forward difference
+        gradient with absolute step `epsilon`, as L-BFGS-B would approximate
+        it, but with `x` and all displaced points evaluated as one batch. Steps
+        which would leave the bounds are taken backwards."""
+        h = np.full(x.size, epsilon)
+        if upper is not None:
+            violated = x + h > upper
+            if lower is not None:
+                violated &= x - h >= lower
+            h[violated] *= -1
+        xs = np.tile(x, (x.size + 1, 1))
+        xs[np.arange(1, x.size + 1), np.arange(x.size)] += h
+        # recompute steps as exactly representable numbers
+        h = np.diagonal(xs[1:]) - x
+        fs = self.fun_batch(xs)
+        return fs[0], (fs[1:] - fs[0]) / h
 
 
 class LocalSearchWrapper(object):
@@ -413,6 +639,8 @@ class LocalSearchWrapper(object):
     LS_MAXITER_RATIO = 6
     LS_MAXITER_MIN = 100
     LS_MAXITER_MAX = 1000
+    # Absolute finite difference step, L-BFGS-B's default
+    FD_EPSILON = 1e-8
 
     def __init__(self, bounds, func_wrapper, **kwargs):
         self.func_wrapper = func_wrapper
@@ -423,6 +651,8 @@ class LocalSearchWrapper(object):
         self.upper = np.array(bounds_list[1])
 
         # If no minimizer specified, use SciPy minimize with 'L-BFGS-B' method
+        # and, for batched objectives, compute its gradients as one batch
+        self.batch_gradient = not self.kwargs and func_wrapper.batch is not None
         if not self.kwargs:
             n = len(self.lower)
             ls_max_iter = min(
@@ -437,7 +667,16 @@ class LocalSearchWrapper(object):
     def local_search(self, x, e):
         # Run local search from the given x location where energy value is e
         x_tmp = np.copy(x)
-        mres = self.minimizer(self.func_wrapper.fun, x, **self.kwargs)
+        if self.batch_gradient:
+            mres = self.minimizer(
+                self.func_wrapper.fun_and_grad,
+                x,
+                jac=True,
+                args=(self.FD_EPSILON, self.lower, self.upper),
+                **self.kwargs
+            )
+        else:
+            mres = self.minimizer(self.func_wrapper.fun, x, **self.kwargs)
         if "njev" in mres.keys():
             self.func_wrapper.ngev += mres.njev
         if "nhev" in mres.keys():
@@ -454,6 +693,37 @@ class LocalSearchWrapper(object):
             return e, x_tmp
 
 
+def swap_chains(chains, rand_state):
+    """Attempts to exchange the current locations of chains at neighbouring
+    temperatures, starting from the hottest pair. An exchange is accepted
+    with the probability with which the colder chain would accept the
+    location of the hotter one as a move, see `acceptance_probability`.
+    Exchanges are therefore judged on the same scale as the moves within a
+    chain, such that good locations found at high temperature move down the
+    temperature ladder but worse ones do not. Returns the number of accepted
+    exchanges."""
+    n_swaps = 0
+    for k in range(len(chains) - 1, 0, -1):
+        cold = chains[k - 1].energy_state
+        hot = chains[k].energy_state
+        pqv = acceptance_probability(
+            hot.current_energy - cold.current_energy,
+            chains[k - 1].temperature_step,
+            chains[k - 1].acceptance_param,
+        )
+        if rand_state.random_sample() < pqv:
+            cold.current_location, hot.current_location = (
+                hot.current_location,
+                cold.current_location,
+            )
+            cold.current_energy, hot.current_energy = (
+                hot.current_energy,
+                cold.current_energy,
+            )
+            n_swaps += 1
+    return n_swaps
+
+
 def dual_annealing(
     func,
     bounds,
@@ -469,6 +739,15 @@ def dual_annealing(
     no_local_search=False,
     callback=None,
     x0=None,
+    patience=None,
+    atol=0.0,
+    rtol=0.0,
+    time_limit=None,
+    n_chains=1,
+    temperature_ratio=2.0,
+    swap_interval=1,
+    chain_workers=None,
+    cache_size=0,
 ):
     """
     Find the global minimum of a function using Dual Annealing.
@@ -478,7 +757,13 @@ def dual_annealing(
         The objective function to be minimized.  Must be in the form
         ``f(x, *args)``, where ``x`` is the argument in the form of a 1-D array
         and ``args`` is a  tuple of any additional fixed parameters needed to
-        completely specify the function.
+        completely specify the function. If `func` also has a method
+        ``coordinate_move(x, index, x_base, *args)``, it is used to evaluate
+        the strategy chain moves which change only component ``index`` of the
+        current location ``x_base``. If it has a method ``batch(xs, *args)``
+        scoring each row of a 2-D array, it is used wherever several
+        locations can be evaluated together: re-drawing initial locations
+        and the finite difference gradients of the default local search.
     bounds : sequence, shape (n, 2)
         Bounds for variables.  ``(min, max)`` pairs for each element in ``x``,
         defining bounds for the objective function parameter.
@@ -541,13 +826,65 @@ def dual_annealing(
         If the callback implementation returns True, the algorithm will stop.
     x0 : ndarray, shape(n,), optional
         Coordinates of a single n-dimensional starting point.
+    patience : int, optional
+        If given, the search stops early once the best function value has
+        improved by no more than ``atol + rtol * abs(f)`` over the last
+        `patience` iterations, where ``f`` is the best value `patience`
+        iterations ago. Default is None, i.e. no early stopping.
+    atol : float, optional
+        Absolute tolerance for early stopping. Default value is 0.
+    rtol : float, optional
+        Relative tolerance for early stopping. Default value is 0.
+    time_limit : float, optional
+        Wall clock time in seconds after which the search stops and returns
+        the best location found so far, with ``status`` 1 in the result. The
+        limit is checked after each function evaluation of the annealing
+        process and before each local search, so a running local search is
+        finished first. Default is None, i.e. no time limit.
+    n_chains : int, optional
+        Number of Markov chains annealed at the same time (parallel
+        tempering). Chain ``k`` follows the temperature schedule multiplied by
+        ``temperature_ratio**k``, and every `swap_interval` iterations the
+        current locations of chains at neighbouring temperatures are
+        exchanged with the acceptance probability of the colder chain, see
+        `swap_chains`. The first chain starts from `x0`, the others from
+        random locations. Each chain evaluates its own shallow copy of
+        `func`. The chains share the budget of a single chain: each takes
+        every `n_chains`-th step of the temperature schedule of `maxiter`
+        iterations, i.e. runs ``ceil(maxiter / n_chains)`` iterations, and
+        `maxfun` is shared evenly between them. Run in parallel threads, see
+        `chain_workers`, the search therefore takes less wall clock time
+        than a single chain. The result is the best location found by any
+        chain. Default value is 1, the original single chain algorithm.
+    temperature_ratio : float, optional
+        Ratio of the temperatures of neighbouring chains. Default value is 2.
+    swap_interval : int, optional
+        Number of iterations between attempted exchanges. Default value is 1.
+    chain_workers : int, optional
+        Number of threads in which the chains are run. Most of the time of an
+        evaluation is spent in numpy routines that release the GIL, so the
+        chains run concurrently. Default is one thread per chain; with 1, the
+        chains are run one after the other.
+    cache_size : int, optional
+        Maximum number of function values kept in a least recently used
+        cache keyed on the exact location, such that locations evaluated
+        again, e.g. by the local search, are looked up instead. Each chain
+        has its own cache. Default value is 0, i.e. no cache.
     Returns
     -------
     res : OptimizeResult
         The optimization result represented as a `OptimizeResult` object.
         Important attributes are: ``x`` the solution array, ``fun`` the value
         of the function at the solution, and ``message`` which describes the
-        cause of the termination.
+        cause of the termination. ``nit_best`` is the number of iterations
+        after which the solution was found (0 if it is the starting point),
+        and ``energy_history`` holds the best function value before the
+        first and after each iteration. ``status`` is 1 if the search was
+        stopped by `time_limit` and 0 otherwise. ``nit`` counts the
+        iterations of each chain. ``n_swaps`` is the number of accepted
+        exchanges between chains. ``nfev`` includes evaluations
+        answered from the cache, of which there were ``cache_hits``, while
+        ``cache_misses`` counts the evaluations of `func`.
         See `OptimizeResult` for a description of other attributes.
     Notes
     -----
@@ -618,6 +955,14 @@ def dual_annealing(
     """  # noqa: E501
     if x0 is not None and not len(x0) == len(bounds):
         raise ValueError("Bounds size does not match x0")
+    if patience is not None and patience < 1:
+        raise ValueError("Patience has to be at least one iteration")
+    if not (atol >= 0 and rtol >= 0):
+        raise ValueError("Tolerances have to be non-negative")
+    if n_chains < 1:
+        raise ValueError("At least one chain is required")
+    if time_limit is not None:
+        deadline = time.monotonic() + time_limit
 
     lu = list(zip(*bounds))
     lower = np.array(lu[0])
@@ -640,71 +985,145 @@ def dual_annealing(
     if not len(lower) == len(upper):
         raise ValueError("Bounds do not have the same dimensions")
 
-    # Wrapper for the objective function
-    func_wrapper = ObjectiveFunWrapper(func, maxfun, *args)
-    # Wrapper fot the minimizer
-    minimizer_wrapper = LocalSearchWrapper(bounds, func_wrapper, **local_search_options)
     # Initialization of RandomState for reproducible runs if seed provided
     rand_state = check_random_state(seed)
-    # Initialization of the energy state
-    energy_state = EnergyState(lower, upper, callback)
-    energy_state.reset(func_wrapper, rand_state, x0)
+    # Further chains get their own objective copy, as objectives may keep
+    # state between calls, and their own random state, seeded from the
+    # given one, so that chains can run in threads
+    chain_funcs = [func]
+    chain_rand_states = [rand_state]
+    if n_chains > 1:
+        seeds = rand_state.randint(2**31 - 1, size=n_chains)
+        swap_rand_state = np.random.RandomState(seeds[0])
+        for chain_seed in seeds[1:]:
+            chain_funcs.append(copy.copy(func))
+            chain_rand_states.append(np.random.RandomState(chain_seed))
+    chains = []
+    for k in range(n_chains):
+        # Wrapper for the objective function
+        func_wrapper = ObjectiveFunWrapper(
+            chain_funcs[k], maxfun / n_chains, *args, cache_size=cache_size
+        )
+        # Wrapper fot the minimizer
+        minimizer_wrapper = LocalSearchWrapper(
+            bounds, func_wrapper, **local_search_options
+        )
+        # Initialization of the energy state
+        energy_state = EnergyState(lower, upper, callback)
+        energy_state.reset(func_wrapper, chain_rand_states[k], x0 if k == 0 else None)
+        # VisitingDistribution instance
+        visit_dist = VisitingDistribution(lower, upper, visit, chain_rand_states[k])
+        # Strategy chain instance
+        strategy_chain = StrategyChain(
+            accept,
+            visit_dist,
+            func_wrapper,
+            minimizer_wrapper,
+            chain_rand_states[k],
+            energy_state,
+        )
+        if time_limit is not None:
+            strategy_chain.deadline = deadline
+        chains.append(strategy_chain)
+    temperature_factors = [temperature_ratio**k for k in range(n_chains)]
+    # steps of the temperature schedule taken by the chains, which share the
+    # iterations of a single chain
+    schedule_steps = range(0, maxiter, n_chains)
+    if chain_workers is None:
+        chain_workers = n_chains
+    pool = None
+    if n_chains > 1 and chain_workers > 1:
+        pool = ThreadPoolExecutor(max_workers=chain_workers)
     # Minimum value of annealing temperature reached to perform
     # re-annealing
     temperature_restart = initial_temp * restart_temp_ratio
-    # VisitingDistribution instance
-    visit_dist = VisitingDistribution(lower, upper, visit, rand_state)
-    # Strategy chain instance
-    strategy_chain = StrategyChain(
-        accept, visit_dist, func_wrapper, minimizer_wrapper, rand_state, energy_state
-    )
     need_to_stop = False
     iteration = 0
+    n_swaps = 0
+    # iteration after which the best energy was last improved, and the best
+    # energy after each iteration, starting with that of the initial location
+    iteration_best = 0
+    energy_history = [min(chain.energy_state.ebest for chain in chains)]
     message = []
     # OptimizeResult object to be returned
     optimize_res = OptimizeResult()
     optimize_res.success = True
     optimize_res.status = 0
 
-    t1 = np.exp((visit - 1) * np.log(2.0)) - 1.0
-    # Run the search loop
-    while not need_to_stop:
-        for i in range(maxiter):
-            # Compute temperature for this step
-            s = float(i) + 2.0
-            t2 = np.exp((visit - 1) * np.log(s)) - 1.0
-            temperature = initial_temp * t1 / t2
-            if iteration >= maxiter:
-                message.append("Maximum number of iteration reached")
-                need_to_stop = True
-                break
-            # Need a re-annealing process?
-            if temperature < temperature_restart:
-                energy_state.reset(func_wrapper, rand_state)
-                break
-            # starting strategy chain
-            val = strategy_chain.run(i, temperature)
-            if val is not None:
-                message.append(val)
-                need_to_stop = True
-                optimize_res.success = False
-                break
-            # Possible local search at the end of the strategy chain
-            if not no_local_search:
-                val = strategy_chain.local_search()
+    try:
+        t1 = np.exp((visit - 1) * np.log(2.0)) - 1.0
+        # Run the search loop
+        while not need_to_stop:
+            for i in schedule_steps:
+                # Compute temperature for this step
+                s = float(i) + 2.0
+                t2 = np.exp((visit - 1) * np.log(s)) - 1.0
+                temperature = initial_temp * t1 / t2
+                if iteration >= len(schedule_steps):
+                    message.append("Maximum number of iteration reached")
+                    need_to_stop = True
+                    break
+                # Need a re-annealing process?
+                if temperature < temperature_restart:
+                    for chain, chain_rand_state in zip(chains, chain_rand_states):
+                        chain.energy_state.reset(chain.func_wrapper, chain_rand_state)
+                    break
+                # starting strategy chains, each followed by a possible local
+                # search
+                ebest_before = energy_history[-1]
+                chain_args = (
+                    [i] * n_chains,
+                    [temperature * factor for factor in temperature_factors],
+                    [no_local_search] * n_chains,
+                )
+                if pool is None:
+                    vals = list(map(StrategyChain.iterate, chains, *chain_args))
+                else:
+                    vals = list(pool.map(StrategyChain.iterate, chains, *chain_args))
+                val = next((val for val in vals if val is not None), None)
                 if val is not None:
                     message.append(val)
                     need_to_stop = True
-                    optimize_res.success = False
+                    if any(chain.time_limit_reached for chain in chains):
+                        # best location so far is still a valid result
+                        optimize_res.status = 1
+                    else:
+                        optimize_res.success = False
                     break
-            iteration += 1
+                iteration += 1
+                energy_history.append(min(chain.energy_state.ebest for chain in chains))
+                if energy_history[-1] < ebest_before:
+                    iteration_best = iteration
+                if n_chains > 1 and iteration % swap_interval == 0:
+                    n_swaps += swap_chains(chains, swap_rand_state)
+                # Converged according to the early stopping criterion?
+                if patience is not None and iteration >= patience:
+                    e_past = energy_history[-1 - patience]
+                    if e_past - energy_history[-1] <= atol + rtol * abs(e_past):
+                        message.append(
+                            "Best energy improved by less than the tolerance "
+                            "over the last {} iterations".format(patience)
+                        )
+                        need_to_stop = True
+                        break
+    finally:
+        if pool is not None:
+            pool.shutdown()
 
     # Setting the OptimizeResult values
-    optimize_res.x = energy_state.xbest
-    optimize_res.fun = energy_state.ebest
+    best_state = min(
+        (chain.energy_state for chain in chains), key=lambda state: state.ebest
+    )
+    optimize_res.x = best_state.xbest
+    optimize_res.fun = best_state.ebest
     optimize_res.nit = iteration
-    optimize_res.nfev = func_wrapper.nfev
-    optimize_res.njev = func_wrapper.ngev
-    optimize_res.nhev = func_wrapper.nhev
+    optimize_res.nit_best = iteration_best
+    optimize_res.energy_history = np.array(energy_history)
+    optimize_res.nfev = sum(chain.func_wrapper.nfev for chain in chains)
+    optimize_res.njev = sum(chain.func_wrapper.ngev for chain in chains)
+    optimize_res.nhev = sum(chain.func_wrapper.nhev for chain in chains)
+    optimize_res.n_swaps = n_swaps
+    optimize_res.cache_hits = sum(chain.func_wrapper.cache_hits for chain in chains)
+    optimize_res.cache_misses = sum(chain.func_wrapper.cache_misses for chain in chains)
     optimize_res.message = message
     return optimize_res
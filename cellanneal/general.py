@@ -1,11 +1,19 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import Value
+from os import cpu_count
+
 import numpy as np
 from pandas import DataFrame, cut, Series
 
 # functional requirements
+from scipy.optimize import nnls
 from scipy.spatial.distance import correlation
 
 # personalized dual_annealing function
 from .dual_annealing import dual_annealing
+from .alignment import GeneAlignment
+from .result import DeconvolutionResult
 
 # we choose to ignore warnings at this stage because console output is
 # part of the user experience - make sure to enable when developing
@@ -21,6 +29,7 @@ def make_gene_dictionary(
     bulk_min=1e-5,
     bulk_max=0.01,
     remove_mito=True,
+    dispersion_norm=None,
 ):
     """Finds highly variable genes across cell types and checks for expression
     thresholds within each bulk separately, returns a dictionary of lists were
@@ -28,11 +37,17 @@ def make_gene_dictionary(
     __alphabetically sorted__ by column names.
     If n_high_var_genes is given, this number of highly variable genes is
     returned. If it is None, the default parameters for flavor='seurat' are
-    used and the length of the resulting gene list depends on availability."""
+    used and the length of the resulting gene list depends on availability.
+    Normalised dispersions of the cell type genes which have been computed
+    before, e.g. stored in a signature index, can be passed as
+    dispersion_norm to skip their calculation."""
     # order bulk columns alphabetically
     bulk_df = bulk_df.sort_index(axis=1)
     # first, find the most variable genes across cell types
-    high_var_genes = find_high_var_genes(celltype_df, disp_min=disp_min)
+    if dispersion_norm is None:
+        high_var_genes = find_high_var_genes(celltype_df, disp_min=disp_min)
+    else:
+        high_var_genes = select_high_var_genes(dispersion_norm, disp_min=disp_min)
 
     print(
         """{} highly variable genes identified in cell type
@@ -41,15 +56,18 @@ def make_gene_dictionary(
         )
     )
 
-    # now, for each bulk, we find the genes which comply with our expression
-    # thresholds, and then keep only those highly variable genes which do
+    # now, for all bulks at once, we find the genes which comply with our
+    # expression thresholds, and then keep only those highly variable genes
+    # which do; the result is a genes x samples boolean mask
+    mask = find_thr_gene_mask(
+        bulk_df, min_thr=bulk_min, max_thr=bulk_max, remove_mito=remove_mito
+    )
+    mask &= bulk_df.index.isin(high_var_genes)[:, None]
+
     # to ensure usage of correct gene list later one, store in dict
     gene_dict = {}
-    for bulk in bulk_df.columns:
-        min_max_genes = find_thr_genes(
-            bulk_df[bulk], min_thr=bulk_min, max_thr=bulk_max, remove_mito=remove_mito
-        )
-        thr_highvar_genes = [x for x in min_max_genes if x in high_var_genes]
+    for j, bulk in enumerate(bulk_df.columns):
+        thr_highvar_genes = bulk_df.index[mask[:, j]].tolist()
         gene_dict[bulk] = thr_highvar_genes
         print(
             "\t{} of these are within thresholds for sample {}".format(
@@ -69,13 +87,30 @@ def calc_gene_expression(mix_vec, bulk_vec, celltype_df, gene_list):
 
     # subset celltype_df and bulk_vec to the genes supplied in gene_list
     bulk_vec_sub = bulk_vec.loc[gene_list].values
-    bulk_vec_sub_comp = bulk_vec_sub / bulk_vec_sub.sum()
     celltype_df_sub = celltype_df.loc[gene_list].values
 
+    return calc_gene_expression_arrays(
+        mix_vec, bulk_vec_sub, celltype_df_sub, gene_list
+    )
+
+
+def calc_gene_expression_arrays(mix_vec, bulk_vec_sub, celltype_sub, gene_list):
+    """Same as calc_gene_expression, for bulk and signature data which have
+    already been subset to the genes in gene_list, e.g. with a GeneAlignment,
+    and are given as numpy arrays."""
     # calculate the mixed gene expression vector
-    mixed_expression = np.dot(mix_vec, celltype_df_sub.T).T
+    mixed_expression = np.dot(mix_vec, celltype_sub.T).T
     mixed_expression_comp = mixed_expression / mixed_expression.sum()
 
+    return compare_gene_expression(bulk_vec_sub, mixed_expression_comp, gene_list)
+
+
+def compare_gene_expression(bulk_vec_sub, mixed_expression_comp, gene_list):
+    """Same as calc_gene_expression_arrays, for a mixed expression vector
+    which has already been calculated and made compositional, e.g. as kept
+    in a DeconvolutionResult."""
+    bulk_vec_sub_comp = bulk_vec_sub / bulk_vec_sub.sum()
+
     # calculate fold change as experimental over mixed
     exp_over_mixed = bulk_vec_sub_comp / mixed_expression_comp
     log_exp_over_mixed = np.log10(exp_over_mixed)
@@ -104,6 +139,24 @@ def find_high_var_genes(
     """Finds highly variable genes across cell types in celltype_df.
     The implementation follows scanpy's highly_variable_genes procedure for
     flavor 'Seurat'."""
+    dispersion_norm = calc_dispersions_norm(celltype_df)
+    return select_high_var_genes(dispersion_norm, disp_min=disp_min)
+
+
+def select_high_var_genes(dispersion_norm, disp_min=0.5):
+    """Given the normalised dispersions of all genes as a pandas series,
+    returns the list of genes whose normalised dispersion exceeds disp_min."""
+    gene_subset = dispersion_norm.values > disp_min
+    return dispersion_norm.index[gene_subset].tolist()
+
+
+def calc_dispersions_norm(celltype_df):
+    """Calculates the dispersion of each gene across cell types in celltype_df,
+    normalised with respect to genes of similar mean expression as in
+    scanpy's highly_variable_genes procedure for flavor 'Seurat'. Returns a
+    float32 pandas series indexed by gene, where genes without a defined
+    normalised dispersion are set to 0. These values do not depend on any
+    threshold and can therefore be computed once per reference."""
     # normalize counts within each celltype to sum 1
     sc_ref_norm = celltype_df.div(celltype_df.sum(axis=0), axis=1)
 
@@ -150,18 +203,11 @@ def find_high_var_genes(
         df["dispersions"].values - disp_mean_bin[df["mean_bin"].values].values
     ) / disp_std_bin[df["mean_bin"].values].values
 
-    # check which genes pass dispersion and expression thresholds
+    # prepare for checking which genes pass the dispersion threshold
     dispersion_norm = df["dispersions_norm"].values.astype("float32")
     dispersion_norm[np.isnan(dispersion_norm)] = 0  # similar to Seurat
-    gene_subset = dispersion_norm > disp_min
-
-    # write to df
-    df["highly_variable"] = gene_subset
-
-    # get list of gene names
-    high_var_genes = df.loc[df["highly_variable"]].index.tolist()
 
-    return high_var_genes
+    return Series(dispersion_norm, index=df.index)
 
 
 def find_thr_genes(
@@ -207,6 +253,28 @@ def find_thr_genes(
     return joint_genes
 
 
+def find_thr_gene_mask(
+    bulk_df,  # pandas dataframe with genes as rows and samples as columns
+    min_thr=1e-5,  # minimum required expression
+    max_thr=0.01,  # maximum allowed expression
+    remove_mito=True,  # if True, remove mitochondrial genes
+):
+    """Vectorised version of find_thr_genes for all samples in bulk_df at
+    once. Returns a boolean array of shape (genes, samples) which is True
+    where a gene passes the thresholds in a sample and, if requested, is not
+    a mitochondrial gene."""
+    values = bulk_df.values
+    colsum = bulk_df.sum(axis=0).values
+    mask = (values < colsum * max_thr) & (values > colsum * min_thr)
+
+    # mitochondrial genes are identified once for all samples
+    if remove_mito:
+        mito = bulk_df.index.str.match("mt-", case=False, na=False)
+        mask &= ~np.asarray(mito, dtype=bool)[:, None]
+
+    return mask
+
+
 # deconvolution functions
 def rankdata(a):
     """
@@ -274,6 +342,168 @@ def calculate_distance(
     return dist
 
 
+class SpearmanDistance(object):
+    """Callable objective equivalent to `calculate_distance` for a single bulk
+    sample, which additionally supports incremental evaluation of moves that
+    change only one parameter.
+
+    The unnormalised mixed counts ``sc_data @ params`` of the two most recently
+    used locations are kept. A move of parameter k from a known location then
+    costs a single column update of length G instead of the full G x K product.
+    As ranking the counts costs the same either way, this saves a noticeable
+    part of an evaluation only for signatures with many cell types, e.g. 30%
+    for 100 cell types but 7% for 19, see `examples/benchmark_objective.py`.
+    Normalising the parameters to sum 1 is not needed here because it does not
+    change the ranks; it is applied to the final result by `return_mixture`.
+
+    The correlation itself is computed as a single dot product between the
+    freshly ranked mixture and the bulk ranks, which have been centred and
+    scaled to unit norm once beforehand by `standardise_ranks`. If the mixed
+    counts contain no ties, their ranks are a permutation of 1..G with known
+    mean and variance; otherwise the tie-averaged ranks are used. Batches of
+    candidates can be scored at once with `batch`.
+
+    The mixed counts are always computed in double precision, also for
+    float32 signature data, as rounding them to single precision would
+    introduce rank ties and thereby change the distance.
+
+    Parameters
+    ----------
+    comp_vec_scaled : ndarray, shape (G,)
+        Ranked bulk expression of the genes used for this sample, centred and
+        scaled with `standardise_ranks`.
+    sc_data : ndarray, shape (G, K)
+        Signature data of the same genes for all K cell types.
+    sc_columns : ndarray, shape (K, G), optional
+        Contiguous transpose of `sc_data`. Can be passed to share it between
+        samples with the same genes; computed if not given.
+    """
+
+    # number of incremental column updates after which the mixed counts are
+    # recomputed from scratch to avoid accumulating rounding errors
+    REFRESH_INTERVAL = 1000
+
+    def __init__(self, comp_vec_scaled, sc_data, sc_columns=None):
+        self.comp_vec_scaled = comp_vec_scaled
+        self.sc_data = np.ascontiguousarray(sc_data, dtype=float)
+        # cell type columns stored as contiguous rows for the column updates
+        if sc_columns is None:
+            sc_columns = self.sc_data.T
+        self.sc_columns = np.ascontiguousarray(sc_columns, dtype=float)
+        # cached (params, mixed counts, number of updates since refresh)
+        self._base = None
+        self._last = None
+        # ranks 1..G and the norm of their centred version, used without ties
+        n_genes = len(comp_vec_scaled)
+        self._ranks = np.arange(1, n_genes + 1, dtype=float)
+        self._rank_norm = np.sqrt(n_genes * (n_genes**2 - 1) / 12.0)
+
+    def __call__(self, params):
+        counts = np.dot(self.sc_data, params)
+        self._last = (np.array(params, dtype=float), counts, 0)
+        return self.distance(counts)
+
+    def coordinate_move(self, params, index, params_base):
+        """Returns the distance for `params`, which equals `params_base` except
+        for entry `index`."""
+        base = self._cached(params_base)
+        if base is None or base[2] >= self.REFRESH_INTERVAL:
+            counts_base = np.dot(self.sc_data, params_base)
+            self._base = (np.array(params_base, dtype=float), counts_base, 0)
+        else:
+            self._base = base
+        _, counts_base, n_updates = self._base
+        counts = counts_base + (params[index] - params_base[index]) * (
+            self.sc_columns[index]
+        )
+        self._last = (np.array(params, dtype=float), counts, n_updates + 1)
+        return self.distance(counts)
+
+    def batch(self, params_batch):
+        """Returns the distances for a batch of parameter vectors given as the
+        rows of a (B, K) array, using one matrix-matrix product and a single
+        row-wise sort for the whole batch."""
+        counts = np.dot(np.atleast_2d(params_batch), self.sc_columns)
+        sorter = np.argsort(counts, axis=1, kind="quicksort")
+        sorted_counts = np.take_along_axis(counts, sorter, axis=1)
+        no_ties = np.all(sorted_counts[:, 1:] != sorted_counts[:, :-1], axis=1)
+        dists = np.empty(len(counts))
+        corrs = np.dot(self.comp_vec_scaled[sorter[no_ties]], self._ranks)
+        dists[no_ties] = 1 - corrs / self._rank_norm
+        for b in np.flatnonzero(~no_ties):
+            dists[b] = self.distance(counts[b])
+        return dists
+
+    def _cached(self, params):
+        # look up whether the mixed counts of these params are still known
+        for entry in (self._base, self._last):
+            if entry is not None and np.array_equal(entry[0], params):
+                return entry
+        return None
+
+    def distance(self, mixed_counts):
+        """One minus Spearman correlation between the bulk and the mixture."""
+        sorter = np.argsort(mixed_counts, kind="quicksort")
+        sorted_counts = mixed_counts[sorter]
+        if np.all(sorted_counts[1:] != sorted_counts[:-1]):
+            # the bulk vector is centred, so the mixture ranks need not be
+            corr = np.dot(self.comp_vec_scaled[sorter], self._ranks)
+            return 1 - corr / self._rank_norm
+        # with ties, fall back to averaged ranks and their actual spread
+        mixed_ranked = rankdata(mixed_counts)
+        mixed_centred = mixed_ranked - mixed_ranked.mean()
+        mixed_norm = np.sqrt(np.dot(mixed_centred, mixed_centred))
+        if mixed_norm == 0:
+            return np.nan
+        return 1 - np.dot(self.comp_vec_scaled, mixed_centred) / mixed_norm
+
+
+class SimplexSpearmanDistance(SpearmanDistance):
+    """Variant of `SpearmanDistance` taking K - 1 parameters in [0, 1], which
+    are mapped to mixture weights on the simplex by `stick_breaking`. The
+    distance only depends on the proportions of the weights, so this removes
+    the direction along which the distance over [0, 1]^K is flat. Moving a
+    single parameter changes several weights, so such moves are not
+    evaluated incrementally."""
+
+    coordinate_move = None
+
+    def __call__(self, params):
+        return SpearmanDistance.__call__(self, stick_breaking(params))
+
+    def batch(self, params_batch):
+        return SpearmanDistance.batch(self, stick_breaking(np.atleast_2d(params_batch)))
+
+
+def stick_breaking(params):
+    """Maps points of the unit cube [0, 1]^(K-1), given as a vector or as the
+    rows of a 2-D array, to mixture weights summing to 1: weight k takes the
+    fraction params[k] of what the weights before it left over, and the last
+    weight takes the rest."""
+    params = np.asarray(params, dtype=float)
+    ones = np.ones(params.shape[:-1] + (1,))
+    # length of the stick left over before each weight
+    left = np.concatenate((ones, np.cumprod(1 - params, axis=-1)), axis=-1)
+    return left * np.concatenate((params, ones), axis=-1)
+
+
+def inverse_stick_breaking(weights):
+    """Parameters in [0, 1]^(K-1) which stick_breaking maps to the mixture
+    weights proportional to weights."""
+    weights = np.asarray(weights, dtype=float) / np.sum(weights)
+    left = 1 - np.concatenate(([0.0], np.cumsum(weights)[:-2]))
+    params = np.divide(weights[:-1], left, out=np.zeros(len(left)), where=left > 0)
+    return np.clip(params, 0, 1)
+
+
+def standardise_ranks(ranked):
+    """Centres a vector of ranks and scales it to unit norm, such that its
+    Pearson correlation with any other vector reduces to a dot product with
+    that vector's centred and normalised version."""
+    centred = ranked - np.mean(ranked)
+    return centred / np.sqrt(np.dot(centred, centred))
+
+
 # define a function that returns the composition given the parameters of the
 # distribution
 def return_mixture(params):
@@ -283,6 +513,255 @@ def return_mixture(params):
     return mixture
 
 
+# signature and bulk matrices of a worker process, attached once per worker
+# to shared memory by _init_worker so that no data is copied per sample, and
+# the prepared signature subset of the gene set the worker used last
+_worker_signature = None
+_worker_bulk = None
+_worker_blocks = []
+_worker_subset = (None, None)
+_worker_started = None
+
+
+def _to_shared_memory(array):
+    """Copies array into a new named shared memory block, which the caller
+    has to close and unlink once all workers are done."""
+    # shared memory needs Python 3.8, imported here such that serial runs
+    # also work with older versions
+    from multiprocessing.shared_memory import SharedMemory
+
+    block = SharedMemory(create=True, size=max(array.nbytes, 1))
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+    view[:] = array
+    return block
+
+
+def _attach_shared_memory(name, shape, dtype):
+    """Returns a zero-copy array view of an existing shared memory block."""
+    from multiprocessing.shared_memory import SharedMemory
+
+    block = SharedMemory(name=name)
+    # keep the block referenced for as long as the view is in use
+    _worker_blocks.append(block)
+    return np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _init_worker(signature_spec, bulk_spec, started=None):
+    global _worker_signature, _worker_bulk, _worker_started
+    _worker_signature = _attach_shared_memory(*signature_spec)
+    _worker_bulk = _attach_shared_memory(*bulk_spec)
+    # counter of samples started across all workers, shared with the parent
+    _worker_started = started
+    # forked workers inherit the parent's random state, so reseed each one
+    np.random.seed()
+
+
+def _prepare_signature(signature, gene_positions):
+    """Subsets the signature to a gene set and prepares the contiguous copies
+    used by SpearmanDistance, to be shared by all samples with this gene set.
+    The copies are in double precision also for float32 signature data, see
+    SpearmanDistance."""
+    sc_sub = np.ascontiguousarray(signature[gene_positions], dtype=float)
+    return sc_sub, np.ascontiguousarray(sc_sub.T)
+
+
+def calc_nnls_start(bulk_sub, sc_sub):
+    """Fits the bulk expression as a non-negative linear combination of the
+    cell type signatures (non-negative least squares on compositional data)
+    and returns the weights scaled into [0, 1] for use as a starting point
+    of annealing, or None if the fit is all zero."""
+    bulk_comp = bulk_sub / bulk_sub.sum()
+    if len(bulk_comp) == 0 or not np.isfinite(bulk_comp).all():
+        return None
+    weights = nnls(sc_sub, bulk_comp)[0]
+    if not np.isfinite(weights).all() or weights.max() <= 0:
+        return None
+    return weights / weights.max()
+
+
+def _anneal(
+    bulk_scaled,
+    sc_sub,
+    sc_columns,
+    maxiter,
+    x0=None,
+    anneal_options=None,
+    simplex=False,
+):
+    if simplex:
+        objective = SimplexSpearmanDistance(bulk_scaled, sc_sub, sc_columns)
+        n_params = sc_sub.shape[1] - 1
+    else:
+        objective = SpearmanDistance(bulk_scaled, sc_sub, sc_columns)
+        n_params = sc_sub.shape[1]
+    return dual_annealing(
+        objective,
+        bounds=[[0, 1] for x in range(n_params)],
+        maxiter=maxiter,
+        no_local_search=False,
+        x0=x0,
+        **(anneal_options or {})
+    )
+
+
+def _sample_time_limit(time_limit, run_deadline, n_remaining, n_parallel=1):
+    """Time limit in seconds for the next sample: the per sample time_limit,
+    shortened if necessary to an equal share of the time left until
+    run_deadline (as given by time.time()) among the n_remaining samples
+    not yet started, of which n_parallel run at the same time."""
+    if run_deadline is None:
+        return time_limit
+    share = (run_deadline - time.time()) * min(1.0, n_parallel / n_remaining)
+    share = max(share, 0.0)
+    if time_limit is None:
+        return share
+    return min(time_limit, share)
+
+
+def _iterations_to_reach(res, target):
+    """Number of iterations after which an annealing run first reached a
+    distance of at most target."""
+    return int(np.argmax(res.energy_history <= target))
+
+
+def _deconvolve_sample(
+    bulk_sub,
+    prepared_signature,
+    maxiter,
+    warm_start=None,
+    compare_warm_start=False,
+    anneal_options=None,
+    time_limit=None,
+    simplex=False,
+):
+    """Runs dual annealing for a single sample, given its bulk expression and
+    signature data subset to its genes by _prepare_signature, and returns the
+    mixture together with the final Spearman and Pearson correlations, a
+    dict with information on the annealing run and the compositional mixed
+    expression. With warm_start="nnls", the
+    annealing starts from a non-negative least squares fit instead of a
+    random point; compare_warm_start additionally runs a random start to
+    report the number of iterations saved. Further keyword arguments for
+    dual_annealing can be given in anneal_options. If time_limit is given,
+    each annealing run returns the best mixture found once it has run for
+    this many seconds. With simplex=True, annealing searches the K - 1
+    stick breaking parameters of the mixture instead of K weights."""
+    sc_sub, sc_columns = prepared_signature
+    # a single cell type leaves nothing to search in the simplex
+    simplex = simplex and sc_sub.shape[1] > 1
+    if time_limit is not None:
+        anneal_options = dict(anneal_options or {}, time_limit=time_limit)
+    bulk_ranked = rankdata(bulk_sub)
+    bulk_scaled = standardise_ranks(bulk_ranked)
+    x0 = None
+    if warm_start == "nnls":
+        x0 = calc_nnls_start(bulk_sub, sc_sub)
+        if simplex and x0 is not None:
+            x0 = inverse_stick_breaking(x0)
+    res = _anneal(
+        bulk_scaled,
+        sc_sub,
+        sc_columns,
+        maxiter,
+        x0=x0,
+        anneal_options=anneal_options,
+        simplex=simplex,
+    )
+    mixture = return_mixture(stick_breaking(res.x) if simplex else res.x)
+    info = {
+        "nit": res.nit,
+        "nit_best": res.nit_best,
+        "nfev": res.nfev,
+        "cache_hits": res.cache_hits,
+        "cache_misses": res.cache_misses,
+        "message": res.message,
+        "time_limit_reached": res.status == 1,
+    }
+    if x0 is not None and compare_warm_start:
+        # compare the iterations both runs needed to reach the distance
+        # which the worse of the two achieved in the end
+        res_random = _anneal(
+            bulk_scaled,
+            sc_sub,
+            sc_columns,
+            maxiter,
+            anneal_options=anneal_options,
+            simplex=simplex,
+        )
+        target = max(res.fun, res_random.fun)
+        info["target_distance"] = target
+        info["nit_to_target"] = _iterations_to_reach(res, target)
+        info["nit_to_target_random"] = _iterations_to_reach(res_random, target)
+        info["nit_saved"] = info["nit_to_target_random"] - info["nit_to_target"]
+
+    # calculate final spearson correlations, in double precision also for
+    # single precision data
+    mixed_counts = np.dot(mixture, sc_sub.T).T
+    mixed_compositional = mixed_counts / mixed_counts.sum()
+    mixed_ranked = rankdata(mixed_counts)
+    spear = 1 - correlation(mixed_ranked, bulk_ranked)
+    pear = 1 - correlation(mixed_compositional, bulk_sub.astype(float))
+    return mixture, spear, pear, info, mixed_compositional
+
+
+def _deconvolve_sample_in_worker(
+    sample_row,
+    gene_set,
+    gene_positions,
+    maxiter,
+    time_limit=None,
+    run_deadline=None,
+    n_samples=1,
+    n_jobs=1,
+    **kwargs
+):
+    """Same as _deconvolve_sample, gathering the sample's genes from the
+    shared bulk and signature matrices by their integer positions. The
+    signature subset is only prepared again if the gene set has changed.
+    The time limit of the sample is determined when it starts, from the
+    number of samples which all workers have started so far."""
+    global _worker_subset
+    if run_deadline is not None:
+        with _worker_started.get_lock():
+            _worker_started.value += 1
+            n_remaining = n_samples - _worker_started.value + 1
+        time_limit = _sample_time_limit(time_limit, run_deadline, n_remaining, n_jobs)
+    if _worker_subset[0] != gene_set:
+        _worker_subset = (
+            gene_set,
+            _prepare_signature(_worker_signature, gene_positions),
+        )
+    return _deconvolve_sample(
+        _worker_bulk[sample_row, gene_positions],
+        _worker_subset[1],
+        maxiter,
+        time_limit=time_limit,
+        **kwargs
+    )
+
+
+def _print_warm_start_info(mixt, info):
+    if "nit_saved" in info:
+        print(
+            "\t{}: distance {:.4f} reached after {} iterations with warm start "
+            "and {} with random start ({} iterations saved)".format(
+                mixt,
+                info["target_distance"],
+                info["nit_to_target"],
+                info["nit_to_target_random"],
+                info["nit_saved"],
+            )
+        )
+
+
+def _print_sample_error(mixt):
+    print(
+        "\nError: Sample {} could not be deconvolved.\nPossibly the gene set for this sample is too small.\nSee online documentation for more info.\n".format(
+            mixt
+        )
+    )
+
+
 # function to select genes according to given threshold and deconvolve the
 # resulting mixture
 def deconvolve(
@@ -290,67 +769,232 @@ def deconvolve(
     bulk_df,
     maxiter,
     gene_dict,
+    n_jobs=1,
+    alignment=None,
+    warm_start=None,
+    compare_warm_start=False,
+    patience=None,
+    atol=0.0,
+    rtol=0.0,
+    time_limit=None,
+    run_time_limit=None,
+    n_chains=1,
+    simplex=False,
+    cache_size=0,
+    result_callback=None,
+    dtype=float,
 ):
+    """Deconvolves each sample in bulk_df based on the genes given for it in
+    gene_dict. If n_jobs is larger than 1, samples are distributed across
+    this many worker processes (-1 uses all available cores). Signature and
+    bulk data are then placed in shared memory once, from which each worker
+    gathers the genes of its current sample. A GeneAlignment of the inputs
+    which has already been built can be passed to avoid building it again.
+    With warm_start="nnls", annealing of each sample starts from a
+    non-negative least squares fit of its bulk data instead of a random
+    point. If compare_warm_start is set as well, each sample is additionally
+    annealed from a random start to report how many iterations the warm
+    start saved until the best mixture was found.
+    If patience is given, annealing of a sample stops early once its best
+    distance has improved by no more than atol + rtol * distance over the
+    last patience iterations.
+    A wall clock time_limit in seconds can be set for each sample and a
+    run_time_limit for all samples together; the remaining run time is split
+    evenly among the samples not yet started. Annealing of a sample which
+    reaches its time limit returns the best mixture found so far.
+    With n_chains larger than 1, each sample is annealed with this many
+    parallel tempering chains running in threads, which share the maxiter
+    iterations, see dual_annealing.
+    With simplex=True, the mixture of each sample is searched in K - 1
+    stick breaking parameters instead of K weights of arbitrary scale.
+    A cache_size larger than 0 keeps this many objective values per sample
+    in an LRU cache, so that repeatedly visited locations are not evaluated
+    again. If given, result_callback(sample, result) is called as soon as
+    each sample is done, with result the DeconvolutionResult holding it;
+    with n_jobs larger than 1, samples are then passed in the order in which
+    they finish.
+    With dtype="float32", signature and mixture data are aligned and shared
+    in single precision, which halves their memory; the objective and the
+    reported correlations are computed in double precision from the
+    signature subset of each gene set. dtype is ignored if an
+    alignment is passed, whose data is used as it is.
+    Returns a DeconvolutionResult with the fractions, correlations and mixed
+    expression of all samples; its to_dataframe() gives the fractions and
+    correlations with samples as rows."""
+    if warm_start not in [None, "nnls"]:
+        raise ValueError("Unknown warm start {}.".format(warm_start))
+    # check the annealing options here, as errors raised while annealing a
+    # sample only mark this sample as failed
+    if patience is not None and patience < 1:
+        raise ValueError("Patience has to be at least one iteration.")
+    if not (atol >= 0 and rtol >= 0):
+        raise ValueError("Tolerances atol and rtol have to be non-negative.")
+    if n_chains < 1:
+        raise ValueError("At least one chain is required.")
+    if time_limit is not None and not time_limit > 0:
+        raise ValueError("Time limit has to be positive.")
+    # a run time limit of zero is used up, e.g. by the chunks of a pipeline
+    # run before, such that each sample returns its starting point
+    if run_time_limit is not None and not run_time_limit >= 0:
+        raise ValueError("Run time limit cannot be negative.")
+    if run_time_limit is not None:
+        run_deadline = time.time() + run_time_limit
+    else:
+        run_deadline = None
     # sort bulk df columns alphabetically to ensure consistency
     bulk_df = bulk_df.sort_index(axis=1)
-    # for each of the bulks, subset bulk and single-cell data according to the
-    # gene list, retain only raw data matrices after this (df --> np.array)
-    sc_list = []
-    bulk_comp_list = []  # compositional version of subset bulk data
-    bulk_ranked_list = []  # ranked version of subset bulk data
-
-    for b, bulk in enumerate(bulk_df.columns):
-
-        # first, subset and rank bulk data
-        bulk_sub = bulk_df[bulk].loc[gene_dict[bulk]].values
-        bulk_comp_list.append(bulk_sub)
-        bulk_ranked = rankdata(bulk_sub)
-        bulk_ranked_list.append(bulk_ranked)
-
-        # next, subset sc data
-        sc_sub = celltype_df.loc[gene_dict[bulk]].values
-        sc_list.append(sc_sub)
-
-    # go through all mixtures and deconvolve them separately
-    mixture_list = []
+    # map each sample's genes to integer positions in the aligned data
+    if alignment is None:
+        alignment = GeneAlignment(celltype_df, bulk_df, gene_dict, dtype=dtype)
+
+    # go through all mixtures and deconvolve them separately, subsetting bulk
+    # and single-cell data according to each sample's gene positions; samples
+    # are grouped by gene set, so that each distinct set is prepared only once
+    result = DeconvolutionResult(alignment)
     # total number of samples for print message
     N_samples = len(bulk_df.columns)
-    for i, mixt in enumerate(bulk_df.columns):
-        print("Deconvolving sample {} of {} ({}) ...".format(i + 1, N_samples, mixt))
-        try:
-            res = dual_annealing(
-                calculate_distance,
-                bounds=[[0, 1] for x in range(len(celltype_df.columns))],
-                maxiter=maxiter,
-                args=[bulk_ranked_list[i], sc_list[i]],
-                no_local_search=False,
+    sample_options = {
+        "warm_start": warm_start,
+        "compare_warm_start": compare_warm_start,
+        "simplex": simplex,
+        "anneal_options": {
+            "patience": patience,
+            "atol": atol,
+            "rtol": rtol,
+            "n_chains": n_chains,
+            "cache_size": cache_size,
+        },
+    }
+    if len(alignment.gene_sets) < N_samples:
+        print(
+            "{} distinct gene sets among {} samples.".format(
+                len(alignment.gene_sets), N_samples
             )
-            mixture = return_mixture(res.x)
-            mixture_list.append(mixture)
-        except ValueError:
-            print(
-                "\nError: Sample {} could not be deconvolved.\nPossibly the gene set for this sample is too small.\nSee online documentation for more info.\n".format(
-                    mixt
+        )
+    if n_jobs == -1:
+        n_jobs = cpu_count()
+    if n_jobs is None or n_jobs <= 1:
+        i = 0
+        for gene_positions, mixts in zip(
+            alignment.gene_sets, alignment.gene_set_samples
+        ):
+            prepared_signature = _prepare_signature(alignment.signature, gene_positions)
+            for mixt in mixts:
+                i += 1
+                print(
+                    "Deconvolving sample {} of {} ({}) ...".format(i, N_samples, mixt)
                 )
-            )
-            mixture = np.empty(len(celltype_df.columns))
-            mixture[:] = np.nan
-            mixture_list.append(mixture)
-
-    # grab the results, write them into a dataframe and return it
-    spears = []
-    pears = []
-    for i, mixture in enumerate(mixture_list):
-        # calculate final spearson correlations
-        mixed_counts = np.dot(mixture, sc_list[i].T).T
-        mixed_compositional = mixed_counts / mixed_counts.sum()
-        mixed_ranked = rankdata(mixed_counts)
-        spears.append(1 - correlation(mixed_ranked, bulk_ranked_list[i]))
-        pears.append(1 - correlation(mixed_compositional, bulk_comp_list[i]))
+                try:
+                    result.add_sample(
+                        mixt,
+                        *_deconvolve_sample(
+                            alignment.sample_bulk(mixt),
+                            prepared_signature,
+                            maxiter,
+                            time_limit=_sample_time_limit(
+                                time_limit, run_deadline, N_samples - i + 1
+                            ),
+                            **sample_options
+                        )
+                    )
+                    _print_warm_start_info(mixt, result.info[mixt])
+                except ValueError:
+                    _print_sample_error(mixt)
+                    result.add_failed_sample(mixt)
+                if result_callback is not None:
+                    result_callback(mixt, result)
+            del prepared_signature
+    else:
+        print("Deconvolving {} samples in {} processes ...".format(N_samples, n_jobs))
+        signature = alignment.signature
+        bulk = alignment.bulk
+        blocks = []
+        started = Value("i", 0)
+        try:
+            blocks.append(_to_shared_memory(signature))
+            blocks.append(_to_shared_memory(bulk))
+            with ProcessPoolExecutor(
+                max_workers=n_jobs,
+                initializer=_init_worker,
+                initargs=(
+                    (blocks[0].name, signature.shape, signature.dtype),
+                    (blocks[1].name, bulk.shape, bulk.dtype),
+                    started,
+                ),
+            ) as pool:
+                # submit grouped by gene set, so that workers mostly receive
+                # consecutive samples sharing a prepared signature subset
+                futures = {}
+                for g, (gene_positions, mixts) in enumerate(
+                    zip(alignment.gene_sets, alignment.gene_set_samples)
+                ):
+                    for mixt in mixts:
+                        future = pool.submit(
+                            _deconvolve_sample_in_worker,
+                            alignment.sample_rows[mixt],
+                            g,
+                            gene_positions,
+                            maxiter,
+                            time_limit=time_limit,
+                            run_deadline=run_deadline,
+                            n_samples=N_samples,
+                            n_jobs=n_jobs,
+                            **sample_options
+                        )
+                        futures[future] = mixt
+                # collect results as samples finish, such that result_callback
+                # is not held up by slower samples submitted earlier
+                try:
+                    for i, future in enumerate(as_completed(futures)):
+                        mixt = futures[future]
+                        try:
+                            result.add_sample(mixt, *future.result())
+                            print(
+                                "Deconvolved sample {} of {} ({})".format(
+                                    i + 1, N_samples, mixt
+                                )
+                            )
+                            _print_warm_start_info(mixt, result.info[mixt])
+                        except ValueError:
+                            _print_sample_error(mixt)
+                            result.add_failed_sample(mixt)
+                        if result_callback is not None:
+                            result_callback(mixt, result)
+                except BaseException:
+                    # drop the samples not yet started, such that leaving
+                    # the pool only waits for those already running
+                    for future in futures:
+                        future.cancel()
+                    raise
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    if patience is not None:
+        # the chains of a sample share its iterations, see dual_annealing
+        chain_maxiter = -(-maxiter // n_chains)
+        n_converged = np.sum(
+            (0 < result.nit) & (result.nit < chain_maxiter) & (result.status == 0)
+        )
+        print(
+            "{} of {} samples converged before the maximum number of "
+            "iterations.".format(n_converged, N_samples)
+        )
 
-    data_out = np.hstack((np.array(mixture_list), np.array([spears, pears]).T))
-    cols_out = celltype_df.columns.tolist() + ["rho_Spearman", "rho_Pearson"]
+    if time_limit is not None or run_deadline is not None:
+        n_timed_out = np.sum(result.status == 1)
+        print(
+            "{} of {} samples reached their time limit and returned the best "
+            "mixture found until then.".format(n_timed_out, N_samples)
+        )
 
-    all_mix_df = DataFrame(data=data_out, columns=cols_out, index=bulk_df.columns)
+    if cache_size:
+        n_hits = sum([result.info[mixt].get("cache_hits", 0) for mixt in result.info])
+        n_evals = np.sum(result.nfev)
+        print(
+            "{} of {} objective evaluations were answered from the "
+            "cache.".format(n_hits, n_evals)
+        )
 
-    return all_mix_df
+    return result
@@ -0,0 +1,418 @@
+"""Import of mixture and signature data files with genes as rows, shared
+by the command line interface and the graphical user interface."""
+
+import csv
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from pandas import DataFrame, HDFStore, Index, read_csv, read_excel
+
+# the pyarrow csv parser is used if available, and the C parser otherwise;
+# pyarrow is also needed for Parquet and Feather data files
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    CSV_ENGINE = "pyarrow"
+except ImportError:
+    pyarrow = None
+    CSV_ENGINE = "c"
+
+# data file extensions by format
+TEXT_EXTENSIONS = ["csv", "txt"]
+PARQUET_EXTENSIONS = ["parquet", "pq"]
+FEATHER_EXTENSIONS = ["feather", "arrow"]
+NPZ_EXTENSIONS = ["npz"]
+HDF_EXTENSIONS = ["h5", "hdf5", "hdf"]
+
+# number of lines from which the delimiter of text files is determined
+SNIFF_LINES = 5
+
+# version of the layout of cached data files, and the environment variable
+# which sets the folder of the cache
+CACHE_VERSION = 2
+CACHE_DIR_VARIABLE = "CELLANNEAL_CACHE_DIR"
+# default maximum total size of the cache in MB, and the environment
+# variable which overrides it
+CACHE_MAX_MB = 1024
+CACHE_MAX_MB_VARIABLE = "CELLANNEAL_CACHE_MAX_MB"
+
+
+def sniff_delimiter(file_path):
+    """Determines the delimiter of a text data file from its first lines."""
+    with open(file_path, "r", newline="") as file:
+        sample = "".join([file.readline() for _ in range(SNIFF_LINES)])
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;\t| ").delimiter
+    except csv.Error:
+        # inconsistent lines, fall back to the header alone
+        return csv.Sniffer().sniff(sample.split("\n")[0]).delimiter
+
+
+def clean_data_df(data_df, dtype=float):
+    """Cleans up an imported mixture or signature data set for cellanneal:
+    gene names are made upper case, duplicate genes summed, genes sorted and
+    missing values set to 0, with all values converted to dtype."""
+    data_df = data_df.astype(dtype, copy=False)
+    # here, in order to make further course case insensitive,
+    # change all gene names to uppercase only
+    data_df.index = data_df.index.str.upper()
+    if data_df.index.has_duplicates or data_df.index.hasnans:
+        # if there are duplicate genes, the are summed here, which also sorts
+        # the genes and drops those without a name
+        data_df = data_df.groupby(level=0).sum()
+    else:
+        # otherwise sorting gives the same result much faster
+        data_df = data_df.sort_index()
+    # finally, if there are nan's after import, set them to 0 to
+    # avoid further issues
+    data_df.fillna(0, inplace=True)
+    return data_df
+
+
+def _data_usecols(usecols, columns):
+    # names of the data columns at the positions in usecols, where position
+    # 0 is the gene name column as in text files
+    return [columns[i - 1] for i in usecols if i > 0]
+
+
+def _arrow_schema(file_path, extension):
+    """Arrow schema of a Parquet or Feather file, read without its data."""
+    if pyarrow is None:
+        raise ImportError("Reading Parquet and Feather files requires pyarrow.")
+    if extension in PARQUET_EXTENSIONS:
+        return pyarrow.parquet.read_schema(file_path)
+    return pyarrow.ipc.open_file(file_path).schema
+
+
+def _arrow_columns(schema):
+    """Gene name column and data columns of an arrow schema. The gene names
+    are taken from the index stored by pandas if there is one, and from the
+    first column otherwise."""
+    index_columns = []
+    if schema.pandas_metadata is not None:
+        # range indices are stored as dicts and have no column
+        index_columns = [
+            column
+            for column in schema.pandas_metadata["index_columns"]
+            if isinstance(column, str)
+        ]
+    gene_column = index_columns[0] if index_columns else schema.names[0]
+    data_columns = [
+        name
+        for name in schema.names
+        if name != gene_column and name not in index_columns
+    ]
+    return gene_column, data_columns
+
+
+def _read_arrow(file_path, extension, usecols=None, nrows=None):
+    """Reads a Parquet or Feather file, loading only the selected columns.
+    Feather files are memory-mapped."""
+    schema = _arrow_schema(file_path, extension)
+    gene_column, data_columns = _arrow_columns(schema)
+    columns = None
+    if usecols is not None:
+        columns = [gene_column] + _data_usecols(usecols, data_columns)
+    if nrows == 0:
+        table = schema.empty_table()
+        if columns is not None:
+            table = table.select(columns)
+    elif extension in PARQUET_EXTENSIONS:
+        table = pyarrow.parquet.read_table(file_path, columns=columns)
+    else:
+        table = pyarrow.feather.read_table(file_path, columns=columns, memory_map=True)
+    if nrows is not None:
+        table = table.slice(0, nrows)
+    data_df = table.to_pandas()
+    if gene_column in data_df.columns:
+        # no index stored by pandas, genes are in a regular column
+        data_df = data_df.set_index(gene_column)
+    return data_df
+
+
+def _read_npz(file_path, usecols=None, nrows=None):
+    """Reads a numpy .npz file holding the data matrix as "values" (genes as
+    rows) and the names of its rows and columns as "genes" and "columns".
+    The data matrix is not loaded if nrows is 0."""
+    with np.load(file_path, allow_pickle=False) as npz_file:
+        genes = npz_file["genes"][:nrows]
+        columns = npz_file["columns"]
+        if nrows == 0:
+            values = np.empty((0, len(columns)))
+        else:
+            values = npz_file["values"][:nrows]
+    data_df = DataFrame(values, index=genes, columns=columns)
+    if usecols is not None:
+        data_df = data_df[_data_usecols(usecols, columns)]
+    return data_df
+
+
+def _read_hdf(file_path, usecols=None, nrows=None):
+    """Reads the single data set of an HDF5 file written by pandas. Only the
+    selected columns are read from files in table format."""
+    with HDFStore(file_path, mode="r") as store:
+        keys = store.keys()
+        if len(keys) != 1:
+            raise ValueError(
+                "HDF5 data file {} needs to contain exactly one data "
+                "set.".format(file_path)
+            )
+        if usecols is None:
+            return store.select(keys[0], stop=nrows)
+        columns = _data_usecols(usecols, store.select(keys[0], stop=0).columns)
+        if store.get_storer(keys[0]).is_table:
+            return store.select(keys[0], columns=columns, stop=nrows)
+        # files in fixed format can only be read as a whole
+        return store.select(keys[0], stop=nrows)[columns]
+
+
+def read_data_file(file_path, usecols=None, nrows=None, sep=None):
+    """Reads a data file without cleaning it up, using an import function
+    depending on its extension. Columns in usecols are given by position,
+    with the gene names at position 0. The delimiter of text files is
+    determined from the file unless given as sep."""
+    extension = file_path.name.split(".")[-1]
+    if extension in TEXT_EXTENSIONS:
+        if sep is None:
+            sep = sniff_delimiter(file_path)
+        # the pyarrow parser cannot stop after nrows or select columns by
+        # position
+        engine = CSV_ENGINE if usecols is None and nrows is None else "c"
+        return read_csv(
+            file_path,
+            index_col=0,
+            sep=sep,
+            usecols=usecols,
+            nrows=nrows,
+            engine=engine,
+        )
+    elif extension in ["xlsx"]:
+        return read_excel(
+            file_path, index_col=0, usecols=usecols, nrows=nrows, engine="openpyxl"
+        )
+    elif extension in ["xls"]:
+        return read_excel(
+            file_path, index_col=0, usecols=usecols, nrows=nrows, engine="xlrd"
+        )
+    elif extension in PARQUET_EXTENSIONS + FEATHER_EXTENSIONS:
+        return _read_arrow(file_path, extension, usecols=usecols, nrows=nrows)
+    elif extension in NPZ_EXTENSIONS:
+        return _read_npz(file_path, usecols=usecols, nrows=nrows)
+    elif extension in HDF_EXTENSIONS:
+        return _read_hdf(file_path, usecols=usecols, nrows=nrows)
+    else:
+        raise ImportError
+
+
+def default_cache_dir():
+    """Folder of the parsed input cache, given by the environment variable
+    CELLANNEAL_CACHE_DIR or the user's cache folder otherwise."""
+    if os.environ.get(CACHE_DIR_VARIABLE):
+        return Path(os.environ[CACHE_DIR_VARIABLE])
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "cellanneal"
+
+
+def cache_max_bytes():
+    """Maximum total size of the parsed input cache in bytes, given in MB by
+    the environment variable CELLANNEAL_CACHE_MAX_MB or CACHE_MAX_MB
+    otherwise."""
+    max_mb = os.environ.get(CACHE_MAX_MB_VARIABLE) or CACHE_MAX_MB
+    return int(float(max_mb) * 2**20)
+
+
+def file_content_hash(file_path):
+    """SHA-256 of the content of a file."""
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _cache_entry_path(file_path, dtype, cache_dir):
+    # one entry per data file and dtype, replaced whenever the file changes
+    key = "{}\n{}".format(Path(file_path).resolve(), np.dtype(dtype).str)
+    return cache_dir / hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _file_stamp(file_path):
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _load_cached(entry_path, file_path, stamp):
+    """Cleaned data of file_path from the cache entry at entry_path, or None
+    if there is no entry for the current content of the file."""
+    try:
+        with open(entry_path / "meta.json", "r") as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != CACHE_VERSION:
+        return None
+    if meta["size"] != stamp["size"] or meta["mtime_ns"] != stamp["mtime_ns"]:
+        return None
+    # the content is compared as well, in case it changed without the size
+    # or modification time changing
+    if meta["sha256"] != file_content_hash(file_path):
+        return None
+    values = np.load(entry_path / "values.npy")
+    genes = np.load(entry_path / "genes.npy")
+    data_df = DataFrame(values, index=genes, columns=Index(meta["columns"]))
+    data_df.index.name = meta["index_name"]
+    # mark the entry as recently used for the eviction by prune_cache
+    os.utime(entry_path / "meta.json")
+    return data_df
+
+
+def _store_cached(entry_path, data_df, file_path, stamp):
+    """Stores cleaned data in a cache entry. The entry is written to a
+    temporary folder first and then moved into place, so that it is only
+    found once it is complete."""
+    entry_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = Path(tempfile.mkdtemp(dir=entry_path.parent))
+    try:
+        np.save(temp_path / "values.npy", np.ascontiguousarray(data_df.values))
+        np.save(temp_path / "genes.npy", data_df.index.values.astype(str))
+        meta = dict(
+            stamp,
+            version=CACHE_VERSION,
+            source=str(Path(file_path).resolve()),
+            sha256=file_content_hash(file_path),
+            index_name=data_df.index.name,
+            # kept as JSON values, such that e.g. numeric sample names keep
+            # their type
+            columns=data_df.columns.tolist(),
+        )
+        with open(temp_path / "meta.json", "w") as file:
+            json.dump(meta, file, indent=2)
+        if entry_path.exists():
+            shutil.rmtree(entry_path)
+        os.replace(temp_path, entry_path)
+    finally:
+        shutil.rmtree(temp_path, ignore_errors=True)
+
+
+def prune_cache(cache_dir, max_bytes=None):
+    """Removes the entries of the parsed input cache in cache_dir whose data
+    file no longer exists or which have an outdated layout, and then the
+    least recently used entries until the cache takes at most max_bytes
+    (cache_max_bytes() if not given). Returns the number of removed
+    entries."""
+    if max_bytes is None:
+        max_bytes = cache_max_bytes()
+    entries = []
+    n_removed = 0
+    for entry_path in Path(cache_dir).iterdir():
+        if entry_path.name.startswith("tmp"):
+            # temporary folder of an entry which is still being written
+            continue
+        try:
+            with open(entry_path / "meta.json", "r") as file:
+                meta = json.load(file)
+            last_used = os.stat(entry_path / "meta.json").st_mtime
+            size = sum(path.stat().st_size for path in entry_path.iterdir())
+        except (OSError, ValueError):
+            continue
+        if meta.get("version") != CACHE_VERSION or not Path(meta["source"]).exists():
+            shutil.rmtree(entry_path, ignore_errors=True)
+            n_removed += 1
+        else:
+            entries.append((last_used, size, entry_path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry_path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry_path, ignore_errors=True)
+        total -= size
+        n_removed += 1
+    return n_removed
+
+
+def import_data_file(file_path, dtype=float, use_cache=False, cache_dir=None):
+    """Imports a mixture or signature data file with genes as rows, using an
+    import function depending on its extension, and cleans it up for
+    cellanneal. With use_cache, the cleaned data is stored in a binary cache
+    in cache_dir (default_cache_dir() if not given), from which later imports
+    of the unchanged file are answered without parsing it again. Entries are
+    identified by the path of the file and checked against its size,
+    modification time and content hash. The cache is kept below
+    cache_max_bytes() by prune_cache after each new entry, and data larger
+    than that is not cached."""
+    if not use_cache:
+        return clean_data_df(read_data_file(file_path), dtype=dtype)
+
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    entry_path = _cache_entry_path(file_path, dtype, Path(cache_dir))
+    stamp = _file_stamp(file_path)
+    data_df = _load_cached(entry_path, file_path, stamp)
+    if data_df is not None:
+        print("Using cached import of {}.".format(file_path))
+        return data_df
+    data_df = clean_data_df(read_data_file(file_path), dtype=dtype)
+    if data_df.values.nbytes > cache_max_bytes():
+        return data_df
+    try:
+        _store_cached(entry_path, data_df, file_path, stamp)
+        prune_cache(cache_dir)
+    except OSError:
+        # the cache is only an optimisation, so carry on without it
+        print("Info: Imported data could not be cached in {}.".format(cache_dir))
+    return data_df
+
+
+class ChunkedDataFile(object):
+    """A mixture data file with genes as rows which is read chunk_size
+    columns (samples) at a time, such that data sets with many samples can be
+    processed with bounded memory. Only the header is read on creation.
+    Iterating yields the chunks as cleaned dataframes, each of which is read
+    from the file when it is needed.
+
+    Attributes
+    ----------
+    file_path : Path
+        Path of the data file.
+    chunk_size : int
+        Maximum number of columns per chunk.
+    columns : list
+        Names of all data columns in the file.
+    dtype : dtype
+        Floating point type of the data in the chunks.
+    """
+
+    def __init__(self, file_path, chunk_size, dtype=float):
+        if chunk_size < 1:
+            raise ValueError("Chunks need to contain at least one column.")
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self.dtype = dtype
+        self._sep = None
+        if file_path.name.split(".")[-1] in TEXT_EXTENSIONS:
+            # determine the delimiter once instead of for every chunk
+            self._sep = sniff_delimiter(file_path)
+        self.columns = self._read(nrows=0).columns.tolist()
+
+    def _read(self, usecols=None, nrows=None):
+        return read_data_file(
+            self.file_path, usecols=usecols, nrows=nrows, sep=self._sep
+        )
+
+    def __len__(self):
+        return -(-len(self.columns) // self.chunk_size)
+
+    def __iter__(self):
+        for start in range(0, len(self.columns), self.chunk_size):
+            # columns by position, behind the gene name column at position 0
+            stop = min(start + self.chunk_size, len(self.columns))
+            usecols = [0] + list(range(start + 1, stop + 1))
+            yield clean_data_df(self._read(usecols=usecols), dtype=self.dtype)
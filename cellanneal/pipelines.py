@@ -1,8 +1,243 @@
+import csv
+import hashlib
+import os
 import time
 
-from .general import make_gene_dictionary, deconvolve, calc_gene_expression
+import numpy as np
+from pandas import DataFrame, concat, read_csv
+
+# pyarrow is needed to write the genewise comparison as a Parquet file
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from .alignment import GeneAlignment
+from .general import (
+    make_gene_dictionary,
+    deconvolve,
+    compare_gene_expression,
+    calc_dispersions_norm,
+)
 from .plots import plot_pies, plot_mix_heatmap, plot_mix_heatmap_log, plot_scatter
 
+# file in a run folder recording the finished samples, and the parameters
+# which may differ when a run is resumed
+CHECKPOINT_FILE = "finished_samples.txt"
+RESUME_IGNORED_PARAMETERS = ["number of parallel jobs", "samples per chunk"]
+
+# formats of the genewise comparison: one csv file per sample, or a single
+# long-format file for all samples
+GENEWISE_FORMATS = ["csv", "parquet", "npz"]
+
+
+def gene_set_hash(genes):
+    """SHA-256 of a sample's gene list, to check the gene set of a finished
+    sample when a run is resumed."""
+    return hashlib.sha256("\n".join(genes).encode("utf-8")).hexdigest()
+
+
+def read_checkpoint(checkpoint_path):
+    """Reads the finished samples of a run and the hashes of their gene sets
+    from its checkpoint file. A last line which has not been completely
+    written is ignored."""
+    finished = {}
+    if not checkpoint_path.exists():
+        return finished
+    with open(checkpoint_path, "r") as file:
+        for line in file:
+            if not line.endswith("\n"):
+                break
+            sample_name, genes_hash = line.rstrip("\n").rsplit("\t", 1)
+            finished[sample_name] = genes_hash
+    return finished
+
+
+def read_parameters(param_file_path):
+    """Reads the parameters written to the parameters file of a run."""
+    parameters = {}
+    with open(param_file_path, "r") as file:
+        # skip the title line
+        for line in file.readlines()[1:]:
+            if ": " in line:
+                key, value = line.rstrip("\n").split(": ", 1)
+                parameters[key] = value
+    return parameters
+
+
+class SampleResultWriter(object):
+    """Writes the results of each sample to file as soon as it has been
+    deconvolved: its row of cell type fractions and correlations is appended
+    to the deconvolution results file and its genewise comparison of
+    mixture and estimated expression is written to its own file. Partial
+    results of a running deconvolution can therefore already be used.
+    Once both are written, the sample and the hash of its gene set are
+    appended to a checkpoint file, from which an interrupted run can be
+    resumed. With genewise_format "parquet" or "npz", the genewise
+    comparisons are instead collected in a single compressed long-format
+    file, to which write_genewise adds those of all samples of a
+    DeconvolutionResult at once; close completes this file. As an npz file
+    cannot be appended to, its tables are kept in memory until close, so
+    it is meant for a single DeconvolutionResult rather than for streaming.
+
+    Parameters
+    ----------
+    result_path : Path
+        Deconvolution results file.
+    genexpr_folder_path : Path
+        Folder for the genewise comparison files.
+    bulk_file_ID : str
+        Name of the mixture data set used in the genewise file names.
+    celltypes : list
+        Cell type names.
+    checkpoint_path : Path
+        Checkpoint file recording the finished samples.
+    genewise_format : str, optional
+        "csv" for one genewise comparison file per sample (default), or
+        "parquet" or "npz" for a single file for all samples.
+    """
+
+    def __init__(
+        self,
+        result_path,
+        genexpr_folder_path,
+        bulk_file_ID,
+        celltypes,
+        checkpoint_path,
+        genewise_format="csv",
+    ):
+        if genewise_format not in GENEWISE_FORMATS:
+            raise ValueError("Unknown genewise format {}.".format(genewise_format))
+        if genewise_format == "parquet" and pyarrow is None:
+            raise ValueError("Writing Parquet files requires pyarrow.")
+        self.result_path = result_path
+        self.genexpr_folder_path = genexpr_folder_path
+        self.checkpoint_path = checkpoint_path
+        self.bulk_file_ID = bulk_file_ID
+        self.columns = celltypes + ["rho_Spearman", "rho_Pearson"]
+        self.genewise_format = genewise_format
+        self.genewise_path = genexpr_folder_path / "expression_{}.{}".format(
+            bulk_file_ID, genewise_format
+        )
+        # open Parquet writer, or the collected tables for an npz file
+        self._parquet_writer = None
+        self._genewise_tables = []
+
+    def write_sample(self, sample_name, result):
+        """Writes the results of a sample from the DeconvolutionResult of
+        deconvolve."""
+        row_df = DataFrame(
+            [result.sample_row(sample_name)],
+            index=[sample_name],
+            columns=self.columns,
+        )
+        write_header = not self.result_path.exists()
+        # write the row with a single call, such that an interruption leaves
+        # at most an incomplete last line
+        with open(self.result_path, "a") as file:
+            file.write(row_df.to_csv(header=write_header, index=True, sep=","))
+
+        # the actual and estimated gene expression has to be written per
+        # sample as the genes are sample specific, unless it is collected
+        # in a single file by write_genewise
+        alignment = result.alignment
+        if self.genewise_format == "csv":
+            self._write_sample_genewise(sample_name, result)
+
+        # finally, record the sample as finished
+        genes_hash = gene_set_hash(alignment.sample_genes(sample_name))
+        with open(self.checkpoint_path, "a") as file:
+            file.write("{}\t{}\n".format(sample_name, genes_hash))
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _write_sample_genewise(self, sample_name, result):
+        gene_comp_df = compare_gene_expression(
+            bulk_vec_sub=result.alignment.sample_bulk(sample_name),
+            mixed_expression_comp=result.mixed[sample_name],
+            gene_list=result.alignment.sample_genes(sample_name),
+        )
+        # construct export path for this sample
+        sample_gene_name = (
+            "expression_" + self.bulk_file_ID + "_" + sample_name + ".csv"
+        )
+        sample_gene_path = self.genexpr_folder_path / sample_gene_name
+        gene_comp_df.sort_index(axis=0, inplace=True)
+        # write to a temporary file first, so that the file appears complete
+        temp_path = sample_gene_path.with_name(sample_gene_name + ".tmp")
+        gene_comp_df.to_csv(temp_path, header=True, index=True, sep=",")
+        os.replace(temp_path, sample_gene_path)
+
+    def write_genewise(self, result):
+        """Adds the genewise comparisons of all samples in the
+        DeconvolutionResult result to the single genewise comparison file.
+        Parquet files are written one row group per call, whereas the
+        tables for an npz file are kept until close."""
+        if self.genewise_format == "csv":
+            return
+        gene_comp_df = result.genewise_comparison()
+        if len(gene_comp_df) == 0:
+            return
+        if self.genewise_format == "parquet":
+            table = pyarrow.Table.from_pandas(gene_comp_df, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pyarrow.parquet.ParquetWriter(
+                    self.genewise_path, table.schema, compression="zstd"
+                )
+            self._parquet_writer.write_table(table)
+        else:
+            self._genewise_tables.append(gene_comp_df)
+
+    def close(self):
+        """Completes the single genewise comparison file."""
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+        if self._genewise_tables:
+            gene_comp_df = concat(self._genewise_tables, ignore_index=True)
+            self._genewise_tables = []
+            # each column is stored as an array named after it
+            np.savez_compressed(
+                self.genewise_path,
+                **{
+                    column: gene_comp_df[column].values.astype(
+                        str if column in ["sample", "gene"] else float
+                    )
+                    for column in gene_comp_df.columns
+                }
+            )
+
+    def keep_finished(self, finished):
+        """Removes all rows of samples which are not in finished from the
+        results file of an interrupted run, including any incomplete row."""
+        if not self.result_path.exists():
+            return
+        with open(self.result_path, "r") as file:
+            lines = file.readlines()
+        if not lines or not lines[0].endswith("\n"):
+            # not even the header has been written completely
+            os.remove(self.result_path)
+            return
+        kept = [lines[0]]
+        for line in lines[1:]:
+            if line.endswith("\n") and next(csv.reader([line]))[0] in finished:
+                kept.append(line)
+        temp_path = self.result_path.with_name(self.result_path.name + ".tmp")
+        with open(temp_path, "w") as file:
+            file.writelines(kept)
+        os.replace(temp_path, self.result_path)
+
+    def sort_results(self):
+        """Sorts the rows of the results file by sample name and returns
+        them."""
+        all_mix_df = read_csv(
+            self.result_path, index_col=0, float_precision="round_trip"
+        )
+        all_mix_df.sort_index(axis=0, inplace=True)
+        all_mix_df.to_csv(self.result_path, header=True, index=True, sep=",")
+        return all_mix_df
+
 
 def cellanneal_pipe(
     celltype_data_path,  # path object!
@@ -13,15 +248,47 @@ def cellanneal_pipe(
     bulk_min,
     bulk_max,
     maxiter,
-    output_path,
-):  # path object!
+    output_path,  # path object!
+    n_jobs=1,
+    dispersion_norm=None,
+    warm_start=None,
+    compare_warm_start=False,
+    patience=None,
+    atol=0.0,
+    rtol=0.0,
+    time_limit=None,
+    run_time_limit=None,
+    n_chains=1,
+    simplex=False,
+    cache_size=0,
+    resume_path=None,
+    dtype=float,
+    genewise_format="csv",
+):
     """Serves as entrypoint into cellanneal pipeline for both gui and cli
-    once all data and parameters have been collected."""
+    once all data and parameters have been collected. Precomputed normalised
+    dispersions of the signature genes, e.g. from a signature index, can be
+    passed as dispersion_norm. Instead of a dataframe, bulk_df can be a
+    ChunkedDataFile, in which case the mixture data is read and deconvolved
+    chunk by chunk with bounded memory (streaming). The results of each
+    sample are written to file as soon as it has been deconvolved and
+    recorded in a checkpoint file. Given the run folder of an interrupted
+    run as resume_path (a path object), its finished samples are skipped and
+    only the remaining ones are deconvolved, after checking that the run
+    used the same parameters and gene sets; output_path is then not used.
+    With dtype="float32", the data is kept in single precision.
+    With genewise_format "parquet" or "npz", the genewise comparisons of all
+    samples are written to a single compressed long-format file instead of
+    one csv file per sample; such runs cannot be resumed. An npz file can
+    only be written as a whole, so it is not available with streaming,
+    whereas a Parquet file is extended chunk by chunk."""
 
     """ 2) Identify highly variable genes and genes that pass the thresholds
     for each bulk. """
+    streaming = not isinstance(bulk_df, DataFrame)
+    chunks = bulk_df if streaming else [bulk_df]
     # extract names
-    bulk_names = bulk_df.columns.tolist()
+    bulk_names = list(bulk_df.columns)
     celltypes = celltype_df.columns.tolist()
 
     # check here for uniqueness
@@ -35,30 +302,83 @@ def cellanneal_pipe(
             "Error: The names of the cell types are not unique. Please give a unique name to each cell type."
         )
         return 0
+    if genewise_format != "csv" and resume_path is not None:
+        print(
+            "Error: Runs writing a single genewise comparison file cannot be "
+            "resumed."
+        )
+        return 0
+    if genewise_format == "parquet" and pyarrow is None:
+        print(
+            "Error: Writing the genewise comparison as a Parquet file requires pyarrow."
+        )
+        return 0
+    if genewise_format == "npz" and streaming:
+        print(
+            "Error: The genewise comparison cannot be written as an npz file "
+            "when reading the mixture data in chunks. Please use parquet "
+            "instead."
+        )
+        return 0
 
-    # produce lists of genes on which to base deconvolution
-    print("\n+++ Constructing gene sets ... +++")
-    gene_dict = make_gene_dictionary(
-        celltype_df, bulk_df, disp_min=disp_min, bulk_min=bulk_min, bulk_max=bulk_max
-    )
-
-    """ 3) Run cellanneal. """
-    print("\n+++ Running cellanneal ... +++")
-    all_mix_df = deconvolve(
-        celltype_df=celltype_df, bulk_df=bulk_df, maxiter=maxiter, gene_dict=gene_dict
-    )
-
-    """ 4) Write results to file."""
-    print("\n+++ Writing results to file ... +++")
+    # the parameters of this run, as written to its parameters file
+    parameters = {
+        "mixture data": bulk_data_path,
+        "signature data": celltype_data_path,
+        "minimum expression in mixture": bulk_min,
+        "maximum expression in mixture": bulk_max,
+        "minimum dispersion": disp_min,
+        "maximum number of iterations": maxiter,
+        "number of parallel jobs": n_jobs,
+        "warm start": warm_start,
+        "early stopping patience": patience,
+        "early stopping tolerances": "atol={}, rtol={}".format(atol, rtol),
+        "time limit per sample (s)": time_limit,
+        "time limit for all samples (s)": run_time_limit,
+        "annealing chains per sample": n_chains,
+        "simplex parametrisation": simplex,
+        "objective cache size": cache_size,
+        "floating point precision": np.dtype(dtype).name,
+        "genewise comparison format": genewise_format,
+    }
+    if streaming:
+        parameters["samples per chunk"] = bulk_df.chunk_size
 
-    # make top level folder for all results from this run
-    # get timestamp for labelling
-    timestamp = time.asctime().replace(" ", "_").replace(":", "-")
     bulk_file_name = bulk_data_path.name
     bulk_file_ID = bulk_file_name.split(".")[0]
-    top_folder_name = "cellanneal_" + bulk_file_ID + "_" + timestamp
-    top_folder_path = output_path / top_folder_name
-    top_folder_path.mkdir(parents=True, exist_ok=True)
+    if resume_path is None:
+        # make top level folder for all results from this run
+        # get timestamp for labelling
+        timestamp = time.asctime().replace(" ", "_").replace(":", "-")
+        top_folder_name = "cellanneal_" + bulk_file_ID + "_" + timestamp
+        top_folder_path = output_path / top_folder_name
+        top_folder_path.mkdir(parents=True, exist_ok=True)
+    else:
+        # continue in the folder of the interrupted run, provided that it
+        # was started with the same parameters
+        top_folder_path = resume_path
+        param_file_paths = sorted(top_folder_path.glob("parameters_*.txt"))
+        if not param_file_paths:
+            print(
+                "Error: {} does not contain the parameters file of a "
+                "cellanneal run.".format(top_folder_path)
+            )
+            return 0
+        param_file_path = param_file_paths[0]
+        timestamp = param_file_path.stem[len("parameters_") :]
+        saved_parameters = read_parameters(param_file_path)
+        differing = [
+            key
+            for key in set(parameters) | set(saved_parameters)
+            if key not in RESUME_IGNORED_PARAMETERS
+            and str(parameters.get(key)) != saved_parameters.get(key)
+        ]
+        if differing:
+            print(
+                "Error: The run in {} cannot be resumed, as it used different "
+                "parameters ({}).".format(top_folder_path, ", ".join(sorted(differing)))
+            )
+            return 0
 
     # make subfolders for deconv, gen expr and figures
     deconv_folder_path = top_folder_path / "deconvolution_results"
@@ -68,43 +388,135 @@ def cellanneal_pipe(
     genexpr_folder_path = top_folder_path / "genewise_comparison"
     genexpr_folder_path.mkdir(parents=True, exist_ok=True)
 
-    # first, write the mix matrix to csv
+    # write a text file with all parameters
+    if resume_path is None:
+        param_file_path = top_folder_path / "parameters_{}.txt".format(timestamp)
+        with open(param_file_path, "a") as file:
+            file.write(
+                "parameters and data used for this cellanneal run ({})\n\n".format(
+                    timestamp
+                )
+            )
+            for key, value in parameters.items():
+                file.write("{}: {}\n".format(key, value))
+
+    # results are written to the deconvolution results file as they come
     deconv_name = "deconvolution_" + bulk_file_ID + ".csv"
     result_path = deconv_folder_path / deconv_name
-    all_mix_df.sort_index(axis=0, inplace=True)
-    all_mix_df.to_csv(result_path, header=True, index=True, sep=",")
-
-    # next, write the actual and estimated gene expression to file,
-    # this has to be done per sample as the genes are sample specific
-    # a mix_df version without correlation entries is needed
-    all_mix_df_no_corr = all_mix_df[celltypes]
-    for sample_name in bulk_names:
-        gene_comp_df = calc_gene_expression(
-            mix_vec=all_mix_df_no_corr.loc[sample_name],
-            bulk_vec=bulk_df[sample_name],
-            celltype_df=celltype_df,
-            gene_list=gene_dict[sample_name],
+    writer = SampleResultWriter(
+        result_path,
+        genexpr_folder_path,
+        bulk_file_ID,
+        celltypes,
+        top_folder_path / CHECKPOINT_FILE,
+        genewise_format=genewise_format,
+    )
+    # samples finished before the run was interrupted
+    finished = {}
+    if resume_path is not None:
+        finished = read_checkpoint(writer.checkpoint_path)
+        writer.keep_finished(finished)
+        print(
+            "\n+++ Resuming run, {} of {} samples are already finished. +++".format(
+                len([name for name in bulk_names if name in finished]), len(bulk_names)
+            )
         )
-        # construct export path for this sample
-        sample_gene_name = "expression_" + bulk_file_ID + "_" + sample_name + ".csv"
-        sample_gene_path = genexpr_folder_path / sample_gene_name
-        gene_comp_df.sort_index(axis=0, inplace=True)
-        gene_comp_df.to_csv(sample_gene_path, header=True, index=True, sep=",")
 
-    # write a text file with all parameters
-    param_file_path = top_folder_path / "parameters_{}.txt".format(timestamp)
-    with open(param_file_path, "a") as file:
-        file.write(
-            "parameters and data used for this cellanneal run ({})\n\n".format(
-                timestamp
+    # the dispersions of the signature genes are the same for all chunks
+    if dispersion_norm is None:
+        dispersion_norm = calc_dispersions_norm(celltype_df)
+    if run_time_limit is not None:
+        run_deadline = time.time() + run_time_limit
+    n_done = 0
+    n_remaining = len([name for name in bulk_names if name not in finished])
+    # the single genewise comparison file is completed also if the run
+    # stops early
+    try:
+        for chunk_df in chunks:
+            if streaming:
+                print(
+                    "\n+++ Reading samples {} to {} of {} ... +++".format(
+                        n_done + 1, n_done + len(chunk_df.columns), len(bulk_names)
+                    )
+                )
+            n_done += len(chunk_df.columns)
+            # produce lists of genes on which to base deconvolution
+            print("\n+++ Constructing gene sets ... +++")
+            gene_dict = make_gene_dictionary(
+                celltype_df,
+                chunk_df,
+                disp_min=disp_min,
+                bulk_min=bulk_min,
+                bulk_max=bulk_max,
+                dispersion_norm=dispersion_norm,
             )
-        )
-        file.write("mixture data: {}\n".format(bulk_data_path))
-        file.write("signature data: {}\n".format(celltype_data_path))
-        file.write("minimum expression in mixture: {}\n".format(bulk_min))
-        file.write("maximum expression in mixture: {}\n".format(bulk_max))
-        file.write("minimum dispersion: {}\n".format(disp_min))
-        file.write("maximum number of iterations: {}\n".format(maxiter))
+            # map genes to integer positions once for all further steps
+            alignment = GeneAlignment(celltype_df, chunk_df, gene_dict, dtype=dtype)
+
+            # skip finished samples, whose gene sets have to be unchanged
+            todo = [name for name in chunk_df.columns if name not in finished]
+            for sample_name in chunk_df.columns:
+                if sample_name in finished and finished[sample_name] != gene_set_hash(
+                    alignment.sample_genes(sample_name)
+                ):
+                    print(
+                        "Error: The genes selected for sample {} differ from "
+                        "those of the interrupted run, please check that the "
+                        "data has not changed.".format(sample_name)
+                    )
+                    return 0
+            if not todo:
+                continue
+            if len(todo) < len(chunk_df.columns):
+                chunk_df = chunk_df[todo]
+                deconv_alignment = None
+            else:
+                deconv_alignment = alignment
+
+            # the time left for the run is shared between the chunks by their
+            # number of samples
+            chunk_time_limit = None
+            if run_time_limit is not None:
+                chunk_time_limit = max(
+                    (run_deadline - time.time()) * len(todo) / n_remaining, 0.0
+                )
+            n_remaining -= len(todo)
+
+            """ 3) Run cellanneal. """
+            print("\n+++ Running cellanneal ... +++")
+            result = deconvolve(
+                celltype_df=celltype_df,
+                bulk_df=chunk_df,
+                maxiter=maxiter,
+                gene_dict=gene_dict,
+                n_jobs=n_jobs,
+                alignment=deconv_alignment,
+                warm_start=warm_start,
+                compare_warm_start=compare_warm_start,
+                patience=patience,
+                atol=atol,
+                rtol=rtol,
+                time_limit=time_limit,
+                run_time_limit=chunk_time_limit,
+                n_chains=n_chains,
+                simplex=simplex,
+                cache_size=cache_size,
+                result_callback=writer.write_sample,
+                dtype=dtype,
+            )
+            writer.write_genewise(result)
+    finally:
+        writer.close()
+
+    """ 4) Write results to file."""
+    print("\n+++ Writing results to file ... +++")
+    # sort the results file, to which samples were appended in the order in
+    # which they have been deconvolved
+    if streaming or resume_path is not None:
+        all_mix_df = writer.sort_results()
+    else:
+        all_mix_df = result.to_dataframe()
+        all_mix_df.to_csv(result_path, header=True, index=True, sep=",")
 
     """ 5) Produce plots and save to folder"""
     # we only want figures if there are less than 100 samples
@@ -127,10 +539,27 @@ def cellanneal_pipe(
             )
             plot_mix_heatmap_log(all_mix_df, rownorm=False, save_path=heat_log_path)
 
-            scatter_path = figure_folder_path / "scatter_{}.pdf".format(bulk_file_ID)
-            plot_scatter(
-                all_mix_df, bulk_df, celltype_df, gene_dict, save_path=scatter_path
-            )
+            # the scatter plots need the mixture data of all samples at once
+            if streaming:
+                print(
+                    "\nInfo: Scatter plots are not produced when mixture data is "
+                    "read in chunks."
+                )
+            else:
+                scatter_path = figure_folder_path / "scatter_{}.pdf".format(
+                    bulk_file_ID
+                )
+                # the mixed expression is taken from the results unless some
+                # samples were finished before resuming
+                plot_scatter(
+                    all_mix_df,
+                    bulk_df,
+                    celltype_df,
+                    gene_dict,
+                    save_path=scatter_path,
+                    alignment=alignment,
+                    result=result if resume_path is None else None,
+                )
         except:
             print("\nError: Plots could not be created.")
 
@@ -138,8 +567,26 @@ def cellanneal_pipe(
 
 
 def run_cellanneal(
-    celltype_df, bulk_df, disp_min, bulk_min, bulk_max, maxiter
-):  # path object!
+    celltype_df,
+    bulk_df,
+    disp_min,
+    bulk_min,
+    bulk_max,
+    maxiter,
+    n_jobs=1,
+    dispersion_norm=None,
+    warm_start=None,
+    compare_warm_start=False,
+    patience=None,
+    atol=0.0,
+    rtol=0.0,
+    time_limit=None,
+    run_time_limit=None,
+    n_chains=1,
+    simplex=False,
+    cache_size=0,
+    dtype=float,
+):
     """Combines gene set identification and deconvolution into a single
     function.
 
@@ -150,6 +597,29 @@ def run_cellanneal(
     bulk_min   -  minimum expression in mixture data for genes
     bulk_max  -  maximum expression in mixture data for genes
     maxiter  -  maximum number of iterations for scipy's dual annealing
+    n_jobs  -  number of processes across which samples are distributed
+    dispersion_norm  -  optional precomputed normalised dispersions of the
+                        signature genes, e.g. from a signature index
+    warm_start  -  None for random starting points of annealing, or "nnls" to
+                   start from a non-negative least squares fit
+    compare_warm_start  -  if True, also anneal from random starting points
+                           and report the iterations saved by the warm start
+    patience  -  if given, stop annealing a sample once its distance has not
+                 improved by more than atol + rtol * distance over this many
+                 iterations
+    atol, rtol  -  absolute and relative tolerance for early stopping
+    time_limit  -  optional wall clock time limit in seconds per sample, after
+                   which the best mixture found so far is returned
+    run_time_limit  -  optional wall clock time limit in seconds for all
+                       samples, split evenly among the samples not yet started
+    n_chains  -  number of parallel tempering chains per sample, run in threads
+                 and sharing the maxiter iterations
+    simplex  -  if True, search the K - 1 stick breaking parameters of each
+                mixture instead of K cell type weights
+    cache_size  -  number of objective values per sample kept in an LRU
+                   cache, 0 to disable it
+    dtype  -  floating point type in which the data is kept, e.g. "float32"
+              for single precision with half the memory
 
     Output:
     all_mix_df  -  a dataframe containing cell type fractions for each mixture"""
@@ -157,13 +627,33 @@ def run_cellanneal(
     # produce lists of genes on which to base deconvolution
     print("\n+++ Constructing gene sets ... +++")
     gene_dict = make_gene_dictionary(
-        celltype_df, bulk_df, disp_min=disp_min, bulk_min=bulk_min, bulk_max=bulk_max
+        celltype_df,
+        bulk_df,
+        disp_min=disp_min,
+        bulk_min=bulk_min,
+        bulk_max=bulk_max,
+        dispersion_norm=dispersion_norm,
     )
 
     """ 3) Run cellanneal. """
     print("\n+++ Running cellanneal ... +++")
-    all_mix_df = deconvolve(
-        celltype_df=celltype_df, bulk_df=bulk_df, maxiter=maxiter, gene_dict=gene_dict
+    result = deconvolve(
+        celltype_df=celltype_df,
+        bulk_df=bulk_df,
+        maxiter=maxiter,
+        gene_dict=gene_dict,
+        n_jobs=n_jobs,
+        warm_start=warm_start,
+        compare_warm_start=compare_warm_start,
+        patience=patience,
+        atol=atol,
+        rtol=rtol,
+        time_limit=time_limit,
+        run_time_limit=run_time_limit,
+        n_chains=n_chains,
+        simplex=simplex,
+        cache_size=cache_size,
+        dtype=dtype,
     )
 
-    return all_mix_df
+    return result.to_dataframe()
@@ -5,6 +5,8 @@ from seaborn import heatmap
 from scipy.stats import spearmanr
 from scipy.spatial.distance import correlation
 
+from .alignment import GeneAlignment
+
 
 rcParams["axes.prop_cycle"] = cycler(
     color=[
@@ -219,7 +221,15 @@ def plot_1D_lines(mix_df, save_path=None):
 
 
 # function for pie plots from one lcm position set of results
-def plot_scatter(mix_df, bulk_df, celltype_df, gene_dict, save_path=None):
+def plot_scatter(
+    mix_df,
+    bulk_df,
+    celltype_df,
+    gene_dict,
+    save_path=None,
+    alignment=None,
+    result=None,
+):
     # if correlation values are included in the mix_df, remove
     corr_list = []
     if "rho_Spearman" in mix_df.columns:
@@ -237,19 +247,28 @@ def plot_scatter(mix_df, bulk_df, celltype_df, gene_dict, save_path=None):
     else:
         plot_df = mix_df
 
-    # get gene restricted subsets of bulk and sc data
+    # get gene restricted subsets of bulk and sc data, using integer gene
+    # positions which are computed here unless already available; the mixed
+    # expression is taken from a DeconvolutionResult if one is given
+    if result is not None:
+        alignment = result.alignment
+    if alignment is None:
+        alignment = GeneAlignment(celltype_df, bulk_df, gene_dict)
     sc_list = []
     bulk_comp_list = []  # compositional version of subset bulk data
+    mixed_list = []
 
     for b, bulk in enumerate(bulk_df.columns):
         # first, subset bulk data
-        bulk_sub = bulk_df[bulk].loc[gene_dict[bulk]].values
+        bulk_sub = alignment.sample_bulk(bulk)
         bulk_sub = bulk_sub / np.sum(bulk_sub)
         bulk_comp_list.append(bulk_sub)
 
-        # next, subset sc data
-        sc_sub = celltype_df.loc[gene_dict[bulk]].values
-        sc_list.append(sc_sub)
+        # next, subset sc data, or take the mixed expression from the result
+        if result is not None:
+            mixed_list.append(result.mixed[bulk])
+        else:
+            sc_list.append(alignment.sample_signature(bulk))
 
     # for each mixture, plot a scatterplot of mixed vs real bulk
     plot_num = len(bulk_df.columns) + 1
@@ -265,12 +284,13 @@ def plot_scatter(mix_df, bulk_df, celltype_df, gene_dict, save_path=None):
     # onto each axis, plot a scatter after calculating mixture vector
     for i, ax in enumerate(axes.flatten()):
         try:
-            mixed_counts = np.dot(plot_df.iloc[i], sc_list[i].T).T
-            mixed_compositional = mixed_counts / mixed_counts.sum()
+            if result is not None:
+                mixed_compositional = mixed_list[i]
+            else:
+                mixed_counts = np.dot(plot_df.iloc[i], sc_list[i].T).T
+                # make compositional
+                mixed_compositional = mixed_counts / mixed_counts.sum(axis=0)
             comp_vec = bulk_comp_list[i]
-
-            # make compositional
-            mixed_compositional = mixed_counts / mixed_counts.sum(axis=0)
             ax.scatter(
                 comp_vec,
                 mixed_compositional,
@@ -0,0 +1,144 @@
+import numpy as np
+from pandas import DataFrame
+
+
+class DeconvolutionResult(object):
+    """Results of deconvolving the samples of a GeneAlignment with
+    `deconvolve`, kept as arrays together with the mixed expression of each
+    sample, such that writers and plots can use them without computing the
+    mixed expression again or indexing dataframes by gene name.
+
+    Parameters
+    ----------
+    alignment : GeneAlignment
+        Alignment of the deconvolved signature and mixture data.
+
+    Attributes
+    ----------
+    alignment : GeneAlignment
+        Alignment of the deconvolved signature and mixture data, which gives
+        the genes (as positions into `alignment.genes`) used for each sample.
+    samples : list
+        Sample names in the row order of all arrays, alphabetically sorted.
+    celltypes : list
+        Cell type names in the column order of `fractions`.
+    fractions : ndarray, shape (n_samples, n_celltypes)
+        Cell type fractions of each sample, NaN where it failed.
+    spearman : ndarray, shape (n_samples,)
+        Spearman correlation between mixture and mixed expression.
+    pearson : ndarray, shape (n_samples,)
+        Pearson correlation between compositional mixture and mixed
+        expression.
+    nfev : ndarray, shape (n_samples,)
+        Number of objective function evaluations of each sample.
+    nit : ndarray, shape (n_samples,)
+        Number of annealing iterations of each sample.
+    status : ndarray, shape (n_samples,)
+        0 if the annealing of a sample finished, 1 if it reached its time
+        limit and -1 if the sample failed or has not been deconvolved.
+    info : dict
+        Information on the annealing run of each deconvolved sample.
+    mixed : dict
+        Compositional mixed expression of each deconvolved sample, in the
+        order of `alignment.sample_genes(sample)`.
+    """
+
+    def __init__(self, alignment):
+        self.alignment = alignment
+        self.samples = alignment.samples
+        self.celltypes = alignment.celltypes
+        n_samples = len(self.samples)
+        self.fractions = np.full((n_samples, len(self.celltypes)), np.nan)
+        self.spearman = np.full(n_samples, np.nan)
+        self.pearson = np.full(n_samples, np.nan)
+        self.nfev = np.zeros(n_samples, dtype=int)
+        self.nit = np.zeros(n_samples, dtype=int)
+        self.status = np.full(n_samples, -1)
+        self.info = {}
+        self.mixed = {}
+
+    def add_sample(self, sample, fractions, spearman, pearson, info, mixed):
+        """Stores the result of sample as returned by the deconvolution of a
+        single sample."""
+        row = self.alignment.sample_rows[sample]
+        self.fractions[row] = fractions
+        self.spearman[row] = spearman
+        self.pearson[row] = pearson
+        self.nfev[row] = info["nfev"]
+        self.nit[row] = info["nit"]
+        self.status[row] = 1 if info["time_limit_reached"] else 0
+        self.info[sample] = info
+        self.mixed[sample] = mixed
+
+    def add_failed_sample(self, sample):
+        """Marks sample as failed, with NaN fractions and mixed expression."""
+        self.info[sample] = {}
+        self.mixed[sample] = np.full(len(self.alignment.positions[sample]), np.nan)
+
+    def sample_row(self, sample):
+        """Fractions followed by the Spearman and Pearson correlation of
+        sample, i.e. its row of `to_dataframe`."""
+        row = self.alignment.sample_rows[sample]
+        return np.append(self.fractions[row], [self.spearman[row], self.pearson[row]])
+
+    def to_dataframe(self):
+        """Cell type fractions and correlations of all samples as a dataframe
+        with samples as rows."""
+        data_out = np.column_stack((self.fractions, self.spearman, self.pearson))
+        cols_out = self.celltypes + ["rho_Spearman", "rho_Pearson"]
+        return DataFrame(data=data_out, columns=cols_out, index=self.samples)
+
+    def genewise_comparison(self):
+        """Genewise comparison of mixture and mixed expression of all
+        deconvolved samples as one long-format dataframe, sorted by sample
+        and gene. Besides sample and gene names, its columns are the
+        compositional mixture ("bulk") and mixed ("mixed") expression and
+        the fold change of the two ("fold_change", "log10_fold_change") as
+        returned by `calc_gene_expression`. It is built for all samples at
+        once from the stored mixed expression."""
+        samples = [
+            sample
+            for sample in self.samples
+            if sample in self.mixed and len(self.alignment.positions[sample]) > 0
+        ]
+        if not samples:
+            # e.g. if all samples failed, with the same columns and types
+            return DataFrame(
+                {
+                    "sample": np.empty(0, dtype=object),
+                    "gene": np.empty(0, dtype=object),
+                    "bulk": np.empty(0),
+                    "mixed": np.empty(0),
+                    "fold_change": np.empty(0),
+                    "log10_fold_change": np.empty(0),
+                }
+            )
+        positions = [self.alignment.positions[sample] for sample in samples]
+        lengths = np.array([len(pos) for pos in positions], dtype=int)
+        sample_rows = np.repeat(
+            np.array([self.alignment.sample_rows[sample] for sample in samples]),
+            lengths,
+        ).astype(int)
+        gene_positions = np.concatenate(positions)
+
+        # gather all bulk values at once and make them compositional per
+        # sample using the sums of consecutive segments
+        bulk = self.alignment.bulk[sample_rows, gene_positions].astype(float)
+        bulk_sums = np.add.reduceat(bulk, np.cumsum(lengths) - lengths)
+        bulk_comp = bulk / np.repeat(bulk_sums, lengths)
+        mixed_comp = np.concatenate([self.mixed[sample] for sample in samples])
+        exp_over_mixed = bulk_comp / mixed_comp
+
+        # order by sample (rows are in alphabetical order) and gene name
+        gene_rank = np.argsort(np.argsort(self.alignment.genes))
+        order = np.lexsort((gene_rank[gene_positions], sample_rows))
+        return DataFrame(
+            {
+                "sample": np.asarray(self.samples, dtype=object)[sample_rows[order]],
+                "gene": self.alignment.genes[gene_positions[order]],
+                "bulk": bulk_comp[order],
+                "mixed": mixed_comp[order],
+                "fold_change": exp_over_mixed[order],
+                "log10_fold_change": np.log10(exp_over_mixed[order]),
+            }
+        )
@@ -0,0 +1,137 @@
+"""Compiled signature index: a directory holding a signature data set as
+memory-mappable numpy arrays together with its gene-to-position map and the
+threshold independent dispersion statistics used to select highly variable
+genes, so that repeated runs against the same reference skip importing and
+preprocessing it."""
+
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+from pandas import DataFrame, Index, Series
+
+from .general import calc_dispersions_norm, select_high_var_genes
+
+INDEX_VERSION = 1
+INDEX_META_FILE = "index.json"
+
+
+def _content_hash(signature, genes, celltypes, dispersion_norm):
+    """SHA-256 over all arrays stored in a signature index."""
+    sha = hashlib.sha256()
+    sha.update(np.ascontiguousarray(signature).tobytes())
+    sha.update("\n".join(genes).encode("utf-8"))
+    sha.update("\n".join(celltypes).encode("utf-8"))
+    sha.update(np.ascontiguousarray(dispersion_norm).tobytes())
+    return sha.hexdigest()
+
+
+def is_signature_index(path):
+    """Checks whether path points to a compiled signature index."""
+    return (Path(path) / INDEX_META_FILE).is_file()
+
+
+def compile_signature_index(celltype_df, index_path):
+    """Precompiles the signature data in celltype_df (genes as rows, cell types
+    as columns, already cleaned as after import) into a signature index
+    directory at index_path and returns the loaded index."""
+    index_path = Path(index_path)
+    index_path.mkdir(parents=True, exist_ok=True)
+
+    signature = np.ascontiguousarray(celltype_df.values, dtype=float)
+    genes = np.asarray(celltype_df.index.astype(str), dtype=str)
+    celltypes = np.asarray(celltype_df.columns.astype(str), dtype=str)
+    dispersion_norm = calc_dispersions_norm(celltype_df).values
+
+    np.save(index_path / "signature.npy", signature)
+    np.save(index_path / "genes.npy", genes)
+    np.save(index_path / "celltypes.npy", celltypes)
+    np.save(index_path / "dispersions_norm.npy", dispersion_norm)
+
+    # the metadata file is written last, as it marks the index as complete
+    meta = {
+        "version": INDEX_VERSION,
+        "n_genes": len(genes),
+        "n_celltypes": len(celltypes),
+        "sha256": _content_hash(signature, genes, celltypes, dispersion_norm),
+    }
+    with open(index_path / INDEX_META_FILE, "w") as file:
+        json.dump(meta, file, indent=2)
+
+    return load_signature_index(index_path, verify=False)
+
+
+def load_signature_index(index_path, verify=True):
+    """Loads a signature index compiled with compile_signature_index. The
+    signature matrix is memory-mapped rather than read. If verify is True,
+    the content hash is recomputed and compared with the stored one."""
+    index_path = Path(index_path)
+    if not is_signature_index(index_path):
+        raise ValueError("{} is not a cellanneal signature index.".format(index_path))
+    with open(index_path / INDEX_META_FILE, "r") as file:
+        meta = json.load(file)
+    if meta.get("version") != INDEX_VERSION:
+        raise ValueError(
+            "Signature index {} was compiled with an incompatible version of "
+            "cellanneal, please compile it again.".format(index_path)
+        )
+
+    signature = np.load(index_path / "signature.npy", mmap_mode="r")
+    genes = np.load(index_path / "genes.npy")
+    celltypes = np.load(index_path / "celltypes.npy")
+    dispersion_norm = np.load(index_path / "dispersions_norm.npy")
+
+    if verify:
+        content_hash = _content_hash(signature, genes, celltypes, dispersion_norm)
+        if content_hash != meta["sha256"]:
+            raise ValueError(
+                "Signature index {} is corrupted, its content does not match "
+                "the stored hash.".format(index_path)
+            )
+
+    return SignatureIndex(
+        index_path, signature, genes, celltypes, dispersion_norm, meta["sha256"]
+    )
+
+
+class SignatureIndex(object):
+    """A loaded signature index, see compile_signature_index.
+
+    Attributes
+    ----------
+    path : Path
+        Directory of the index.
+    signature : ndarray, shape (n_genes, n_celltypes)
+        Memory-mapped signature data.
+    genes : Index
+        Gene names, mapping each gene to its row position in `signature`.
+    celltypes : list
+        Cell type names.
+    dispersion_norm : Series
+        Normalised dispersion of each gene across cell types.
+    content_hash : str
+        SHA-256 of the index content.
+    """
+
+    def __init__(
+        self, path, signature, genes, celltypes, dispersion_norm, content_hash
+    ):
+        self.path = path
+        self.signature = signature
+        self.genes = Index(genes)
+        self.celltypes = celltypes.tolist()
+        self.dispersion_norm = Series(dispersion_norm, index=self.genes)
+        self.content_hash = content_hash
+
+    def to_dataframe(self):
+        """Signature data as a dataframe on top of the memory-mapped array."""
+        return DataFrame(self.signature, index=self.genes, columns=self.celltypes)
+
+    def high_var_genes(self, disp_min=0.5):
+        """Highly variable genes for the given minimum scaled dispersion."""
+        return select_high_var_genes(self.dispersion_norm, disp_min=disp_min)
+
+    def gene_positions(self, gene_list):
+        """Row positions of the genes in gene_list, -1 for unknown genes."""
+        return self.genes.get_indexer(gene_list)
@@ -0,0 +1,115 @@
+"""Compares deconvolution of the example data in double (float64) and single
+(float32) precision: run time, memory of the aligned data and quality of the
+fitted mixtures.
+
+Annealing is chaotic, so runs on float64 and float32 data diverge even from
+the same random state and their fractions cannot be compared one by one.
+Instead, each precision is run from several random states and every fitted
+mixture is scored with the same double precision objective, its Spearman
+distance to the float64 data. float32 passes if its mean distance exceeds
+that of float64 by no more than N_SE standard errors of the difference.
+
+Usage:
+        python benchmark_float32.py [maxiter] [n_seeds]
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from scipy.spatial.distance import correlation
+
+from cellanneal import GeneAlignment, deconvolve, make_gene_dictionary
+from cellanneal.general import rankdata
+from cellanneal.loader import import_data_file
+
+DATA_PATH = Path(__file__).parent / "example_data"
+MAXITER = 100
+N_SEEDS = 5
+# number of standard errors by which float32 may fall behind float64
+N_SE = 3.0
+
+
+def load(dtype):
+    """Imports the example signature and mixture data in precision dtype."""
+    celltype_df = import_data_file(
+        DATA_PATH / "signature_data_human_liver.csv", dtype=dtype
+    )
+    bulk_df = import_data_file(DATA_PATH / "mixture_data_liver_tumor.csv", dtype=dtype)
+    return celltype_df, bulk_df
+
+
+def mean_distance(alignment, result):
+    """Spearman distance between the mixed expression of the fractions in
+    result and the mixture data of alignment, averaged over all samples."""
+    distances = []
+    for sample, fractions in zip(result.samples, result.fractions):
+        mixed = np.dot(alignment.sample_signature(sample), fractions)
+        bulk = alignment.sample_bulk(sample)
+        distances.append(correlation(rankdata(mixed), rankdata(bulk)))
+    return np.mean(distances)
+
+
+def main():
+    maxiter = int(sys.argv[1]) if len(sys.argv) > 1 else MAXITER
+    n_seeds = int(sys.argv[2]) if len(sys.argv) > 2 else N_SEEDS
+    if n_seeds < 2:
+        sys.exit("At least two random states are needed.")
+
+    # both precisions use the genes selected on the float64 data, which is
+    # also the data all fitted mixtures are scored on
+    data = {"float64": load("float64"), "float32": load("float32")}
+    gene_dict = make_gene_dictionary(*data["float64"])
+    reference = GeneAlignment(*data["float64"], gene_dict)
+
+    run_times = {}
+    distances = {}
+    nbytes = {}
+    for dtype, (celltype_df, bulk_df) in data.items():
+        alignment = GeneAlignment(celltype_df, bulk_df, gene_dict, dtype=dtype)
+        nbytes[dtype] = alignment.signature.nbytes + alignment.bulk.nbytes
+        run_times[dtype] = []
+        distances[dtype] = []
+        for seed in range(n_seeds):
+            np.random.seed(seed)
+            start = time.time()
+            result = deconvolve(
+                celltype_df, bulk_df, maxiter, gene_dict, alignment=alignment
+            )
+            run_times[dtype].append(time.time() - start)
+            distances[dtype].append(mean_distance(reference, result))
+
+    print("\nprecision  run time (s)  aligned data (MB)  mean distance")
+    for dtype in data:
+        print(
+            "{:9}  {:12.2f}  {:17.2f}  {:.5f} +- {:.5f}".format(
+                dtype,
+                np.mean(run_times[dtype]),
+                nbytes[dtype] / 1e6,
+                np.mean(distances[dtype]),
+                np.std(distances[dtype], ddof=1),
+            )
+        )
+
+    difference = np.mean(distances["float32"]) - np.mean(distances["float64"])
+    standard_error = np.sqrt(
+        (np.var(distances["float32"], ddof=1) + np.var(distances["float64"], ddof=1))
+        / n_seeds
+    )
+    print(
+        "\nfloat32 minus float64 mean distance: {:.2e} (standard error "
+        "{:.2e})".format(difference, standard_error)
+    )
+    if difference <= N_SE * standard_error:
+        print("float32 fits as well as float64.")
+    else:
+        print(
+            "float32 fits worse than float64 by more than {} standard "
+            "errors.".format(N_SE)
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
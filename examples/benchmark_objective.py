@@ -0,0 +1,87 @@
+"""Compares the cost of evaluating the Spearman distance objective for a new
+location (full G x K product of signature and mixture) with that of a move
+changing a single parameter (update of one signature column), as used by
+the second half of the strategy chain moves of dual annealing.
+
+Ranking the G mixed counts costs the same in both cases, so the incremental
+update only pays off once the G x K product is a noticeable part of an
+evaluation, i.e. for signatures with many cell types. The moves are timed
+on the first example mixture, with the example signature (19 cell types)
+and with random signatures of the same genes and more cell types.
+
+Usage:
+        python benchmark_objective.py [n_evaluations]
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from cellanneal import GeneAlignment, make_gene_dictionary
+from cellanneal.general import SpearmanDistance, rankdata, standardise_ranks
+from cellanneal.loader import import_data_file
+
+DATA_PATH = Path(__file__).parent / "example_data"
+N_EVALUATIONS = 3000
+N_CELLTYPES = [50, 100, 200]
+
+
+def time_moves(objective, n_celltypes, n_evaluations, rand_state):
+    """Returns the time per evaluation in ms of full evaluations and of
+    single parameter moves, for the same locations."""
+    base = rand_state.random_sample(n_celltypes)
+    objective(base)
+    moves = []
+    for n in range(n_evaluations):
+        moved = base.copy()
+        moved[n % n_celltypes] = rand_state.random_sample()
+        moves.append((moved, n % n_celltypes))
+
+    start = time.perf_counter()
+    for moved, _ in moves:
+        objective(moved)
+    full = time.perf_counter() - start
+    objective(base)
+    start = time.perf_counter()
+    for moved, index in moves:
+        objective.coordinate_move(moved, index, base)
+    incremental = time.perf_counter() - start
+    return 1e3 * full / n_evaluations, 1e3 * incremental / n_evaluations
+
+
+def main():
+    n_evaluations = int(sys.argv[1]) if len(sys.argv) > 1 else N_EVALUATIONS
+
+    bulk_df = import_data_file(DATA_PATH / "mixture_data_liver_tumor.csv")
+    celltype_df = import_data_file(DATA_PATH / "signature_data_human_liver.csv")
+    gene_dict = make_gene_dictionary(celltype_df, bulk_df)
+    alignment = GeneAlignment(celltype_df, bulk_df, gene_dict)
+    sample = alignment.samples[0]
+    bulk_scaled = standardise_ranks(rankdata(alignment.sample_bulk(sample)))
+    signature = alignment.sample_signature(sample)
+    n_genes = len(signature)
+
+    rand_state = np.random.RandomState(0)
+    signatures = [signature] + [
+        rand_state.lognormal(sigma=2.0, size=(n_genes, n_celltypes))
+        for n_celltypes in N_CELLTYPES
+    ]
+
+    print("\ngenes  cell types  full (ms)  single parameter (ms)  saved")
+    for sc_data in signatures:
+        n_celltypes = sc_data.shape[1]
+        objective = SpearmanDistance(bulk_scaled, sc_data)
+        full, incremental = time_moves(
+            objective, n_celltypes, n_evaluations, rand_state
+        )
+        print(
+            "{:5}  {:10}  {:9.3f}  {:21.3f}  {:4.0%}".format(
+                n_genes, n_celltypes, full, incremental, 1 - incremental / full
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -25,6 +25,11 @@ setup(
         "xlrd",
         "openpyxl",
     ],
+    # optional dependencies for binary data files
+    extras_require={
+        "parquet": ["pyarrow"],
+        "hdf5": ["tables"],
+    },
     classifiers=[
         "License :: OSI Approved :: MIT License",
         "Programming Language :: Python",
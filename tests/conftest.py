@@ -0,0 +1,21 @@
+import numpy as np
+from pandas import DataFrame
+
+
+def make_data(n_genes=300, n_celltypes=3, n_samples=4, seed=0):
+    """Small random signature and mixture data sets with upper case gene
+    names, as after import."""
+    rng = np.random.default_rng(seed)
+    genes = ["GENE{:04d}".format(i) for i in range(n_genes)]
+    celltype_df = DataFrame(
+        rng.lognormal(sigma=2.0, size=(n_genes, n_celltypes)),
+        index=genes,
+        columns=["type{}".format(i) for i in range(n_celltypes)],
+    )
+    weights = rng.random((n_celltypes, n_samples))
+    bulk_df = DataFrame(
+        celltype_df.values @ weights * rng.lognormal(sigma=0.1, size=(n_genes, 1)),
+        index=genes,
+        columns=["sample{}".format(i) for i in range(n_samples)],
+    )
+    return celltype_df, bulk_df
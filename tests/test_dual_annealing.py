@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from cellanneal.dual_annealing import dual_annealing, swap_chains
+from cellanneal.general import SpearmanDistance, rankdata, standardise_ranks
+
+from conftest import make_data
+
+
+def spearman_objective(n_celltypes=6, seed=0):
+    celltype_df, bulk_df = make_data(n_celltypes=n_celltypes, seed=seed)
+    bulk_scaled = standardise_ranks(rankdata(bulk_df.values[:, 0]))
+    return SpearmanDistance(bulk_scaled, celltype_df.values)
+
+
+def chain(energy, location, temperature_step=0.0):
+    energy_state = SimpleNamespace(
+        current_energy=energy, current_location=np.array(location)
+    )
+    return SimpleNamespace(
+        energy_state=energy_state,
+        temperature_step=temperature_step,
+        acceptance_param=-5.0,
+    )
+
+
+def test_swap_chains_takes_better_hot_location():
+    rand_state = np.random.RandomState(0)
+    # the hotter chain found a better location, which the colder one takes
+    chains = [chain(1.0, [0.0]), chain(0.0, [1.0])]
+    assert swap_chains(chains, rand_state) == 1
+    assert chains[0].energy_state.current_energy == 0.0
+    assert chains[0].energy_state.current_location[0] == 1.0
+    # but not a worse one
+    assert swap_chains([chain(0.0, [0.0]), chain(1.0, [1.0])], rand_state) == 0
+
+
+def test_swap_acceptance_rate():
+    n_chains = 2
+    n_swaps = 0
+    n_attempts = 0
+    for seed in range(3):
+        res = dual_annealing(
+            spearman_objective(seed=seed),
+            [[0, 1]] * 6,
+            maxiter=400,
+            n_chains=n_chains,
+            chain_workers=1,
+            seed=seed,
+        )
+        n_swaps += res.n_swaps
+        n_attempts += res.nit * (n_chains - 1)
+    # exchanges are selective, neither never nor always accepted
+    assert 0 < n_swaps < n_attempts
+
+
+def test_chains_share_iterations():
+    maxiter = 100
+    single = dual_annealing(spearman_objective(), [[0, 1]] * 6, maxiter=maxiter, seed=0)
+    multi = dual_annealing(
+        spearman_objective(),
+        [[0, 1]] * 6,
+        maxiter=maxiter,
+        n_chains=3,
+        chain_workers=1,
+        seed=0,
+    )
+    assert multi.nit == 34
+    assert multi.nfev < 1.5 * single.nfev
+    assert multi.fun < 2 * single.fun
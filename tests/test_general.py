@@ -0,0 +1,129 @@
+from concurrent.futures import as_completed
+
+import numpy as np
+import pytest
+
+from cellanneal import deconvolve, general, make_gene_dictionary
+from cellanneal.general import (
+    SpearmanDistance,
+    calculate_distance,
+    rankdata,
+    standardise_ranks,
+)
+
+from conftest import make_data
+
+
+def test_parallel_result_callback():
+    celltype_df, bulk_df = make_data()
+    gene_dict = make_gene_dictionary(
+        celltype_df, bulk_df, disp_min=0.0, bulk_min=0.0, bulk_max=1.0
+    )
+    done = []
+
+    def callback(sample, result):
+        # the sample is stored in the result once it is passed
+        assert not np.isnan(result.sample_row(sample)).any()
+        done.append(sample)
+
+    result = deconvolve(
+        celltype_df, bulk_df, 2, gene_dict, n_jobs=2, result_callback=callback
+    )
+    assert sorted(done) == list(bulk_df.columns)
+    assert not np.isnan(result.fractions).any()
+
+
+def test_parallel_result_callback_error(monkeypatch):
+    celltype_df, bulk_df = make_data(n_samples=12)
+    gene_dict = make_gene_dictionary(
+        celltype_df, bulk_df, disp_min=0.0, bulk_min=0.0, bulk_max=1.0
+    )
+    submitted = {}
+
+    def record_as_completed(futures):
+        submitted.update(futures)
+        return as_completed(futures)
+
+    monkeypatch.setattr(general, "as_completed", record_as_completed)
+
+    def callback(sample, result):
+        raise RuntimeError("callback failed")
+
+    with pytest.raises(RuntimeError):
+        deconvolve(
+            celltype_df, bulk_df, 2, gene_dict, n_jobs=2, result_callback=callback
+        )
+    # samples still queued when the callback failed are not deconvolved
+    assert any(future.cancelled() for future in submitted)
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"patience": 0},
+        {"atol": -1e-3},
+        {"rtol": -1e-3},
+        {"time_limit": 0.0},
+        {"run_time_limit": -1.0},
+        {"n_chains": 0},
+    ],
+)
+def test_invalid_annealing_options(options):
+    celltype_df, bulk_df = make_data()
+    gene_dict = make_gene_dictionary(
+        celltype_df, bulk_df, disp_min=0.0, bulk_min=0.0, bulk_max=1.0
+    )
+    with pytest.raises(ValueError):
+        deconvolve(celltype_df, bulk_df, 2, gene_dict, **options)
+
+
+def objective_data(dtype, ties=False):
+    """Ranked bulk expression and signature data of a single sample; with
+    ties, pairs of genes have the same signature and thereby mixed counts."""
+    celltype_df, bulk_df = make_data(n_genes=200, n_celltypes=5)
+    sc_data = celltype_df.values.astype(dtype)
+    if ties:
+        sc_data[1::2] = sc_data[::2]
+    return rankdata(bulk_df.values[:, 0].astype(dtype)), sc_data
+
+
+@pytest.mark.parametrize("ties", [False, True])
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_spearman_distance(dtype, ties):
+    bulk_ranked, sc_data = objective_data(dtype, ties)
+    objective = SpearmanDistance(standardise_ranks(bulk_ranked), sc_data)
+    rng = np.random.default_rng(0)
+    params = rng.random((20, sc_data.shape[1]))
+    expected = [calculate_distance(x, bulk_ranked, sc_data) for x in params]
+
+    assert np.allclose([objective(x) for x in params], expected)
+    assert np.allclose(objective.batch(params), expected)
+
+
+@pytest.mark.parametrize("ties", [False, True])
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_spearman_distance_coordinate_moves(dtype, ties):
+    bulk_ranked, sc_data = objective_data(dtype, ties)
+    objective = SpearmanDistance(standardise_ranks(bulk_ranked), sc_data)
+    rng = np.random.default_rng(0)
+    params = rng.random(sc_data.shape[1])
+    objective(params)
+    # a chain of moves, each from the previous location, long enough for the
+    # mixed counts to be refreshed along the way
+    for n in range(SpearmanDistance.REFRESH_INTERVAL + 50):
+        index = n % len(params)
+        moved = params.copy()
+        moved[index] = rng.random()
+        distance = objective.coordinate_move(moved, index, params)
+        if n % 100 == 0 or n >= SpearmanDistance.REFRESH_INTERVAL:
+            expected = calculate_distance(moved, bulk_ranked, sc_data)
+            assert np.isclose(distance, expected)
+        params = moved
+    # and a move from a location not evaluated before
+    base = rng.random(len(params))
+    moved = base.copy()
+    moved[0] = rng.random()
+    assert np.isclose(
+        objective.coordinate_move(moved, 0, base),
+        calculate_distance(moved, bulk_ranked, sc_data),
+    )
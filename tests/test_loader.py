@@ -0,0 +1,149 @@
+import os
+
+import numpy as np
+import pytest
+from pandas import concat
+from pandas.testing import assert_frame_equal
+
+from cellanneal.loader import (
+    ChunkedDataFile,
+    clean_data_df,
+    import_data_file,
+    prune_cache,
+)
+
+from conftest import make_data
+
+
+def write_csv(data_df, path):
+    data_df.to_csv(path)
+
+
+def write_parquet(data_df, path):
+    pytest.importorskip("pyarrow")
+    data_df.to_parquet(path)
+
+
+def write_parquet_gene_column(data_df, path):
+    # genes in the first column instead of a stored pandas index
+    pytest.importorskip("pyarrow")
+    data_df.reset_index().to_parquet(path, index=False)
+
+
+def write_feather(data_df, path):
+    pytest.importorskip("pyarrow")
+    data_df.reset_index().to_feather(path)
+
+
+def write_npz(data_df, path):
+    np.savez(
+        path,
+        values=data_df.values,
+        genes=data_df.index.values.astype(str),
+        columns=data_df.columns.values.astype(str),
+    )
+
+
+def write_hdf(data_df, path):
+    pytest.importorskip("tables")
+    data_df.to_hdf(path, "data")
+
+
+def write_hdf_table(data_df, path):
+    pytest.importorskip("tables")
+    data_df.to_hdf(path, "data", format="table")
+
+
+WRITERS = [
+    ("csv", write_csv),
+    ("parquet", write_parquet),
+    ("parquet", write_parquet_gene_column),
+    ("feather", write_feather),
+    ("arrow", write_feather),
+    ("npz", write_npz),
+    ("h5", write_hdf),
+    ("h5", write_hdf_table),
+]
+
+
+@pytest.fixture
+def data_df():
+    _, bulk_df = make_data(n_genes=20, n_samples=5)
+    # lower case and unsorted gene names, as cleaned up on import
+    bulk_df.index = bulk_df.index.str.lower()
+    return bulk_df.iloc[::-1]
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+@pytest.mark.parametrize("extension, writer", WRITERS)
+def test_import_data_file(tmp_path, data_df, extension, writer, dtype):
+    path = tmp_path / "data.{}".format(extension)
+    writer(data_df, path)
+    imported = import_data_file(path, dtype=dtype)
+    expected = clean_data_df(data_df.copy(), dtype=dtype)
+    assert_frame_equal(imported, expected, check_names=False)
+
+
+@pytest.mark.parametrize("extension, writer", WRITERS)
+def test_chunked_data_file(tmp_path, data_df, extension, writer):
+    path = tmp_path / "data.{}".format(extension)
+    writer(data_df, path)
+    chunked = ChunkedDataFile(path, 2)
+    assert chunked.columns == data_df.columns.tolist()
+    chunks = list(chunked)
+    assert len(chunks) == len(chunked) == 3
+    assert_frame_equal(
+        concat(chunks, axis=1), import_data_file(path), check_names=False
+    )
+
+
+def test_cache(tmp_path, data_df, capsys):
+    # numeric sample names, which HDF5 files keep and so has the cache
+    data_df.columns = np.arange(len(data_df.columns))
+    path = tmp_path / "data.h5"
+    write_hdf(data_df, path)
+    cache_dir = tmp_path / "cache"
+    uncached = import_data_file(path)
+
+    assert_frame_equal(
+        import_data_file(path, use_cache=True, cache_dir=cache_dir), uncached
+    )
+    assert "cached" not in capsys.readouterr().out
+    assert_frame_equal(
+        import_data_file(path, use_cache=True, cache_dir=cache_dir), uncached
+    )
+    assert "Using cached import" in capsys.readouterr().out
+
+    # a changed file of the same size and modification time is parsed again
+    stat = os.stat(path)
+    write_hdf(data_df * 2, path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert os.stat(path).st_size == stat.st_size
+    changed = import_data_file(path, use_cache=True, cache_dir=cache_dir)
+    assert "cached" not in capsys.readouterr().out
+    assert_frame_equal(changed, import_data_file(path))
+
+
+def test_prune_cache(tmp_path, data_df):
+    cache_dir = tmp_path / "cache"
+    paths = [tmp_path / "data{}.npz".format(i) for i in range(3)]
+    for i, path in enumerate(paths):
+        write_npz(data_df, path)
+        import_data_file(path, use_cache=True, cache_dir=cache_dir)
+        # distinct times of last use, oldest first
+        meta_path = next(
+            entry / "meta.json"
+            for entry in cache_dir.iterdir()
+            if str(path.resolve()) in (entry / "meta.json").read_text()
+        )
+        os.utime(meta_path, (i, i))
+    entry_size = sum(f.stat().st_size for f in meta_path.parent.iterdir())
+
+    # entries of deleted files are removed
+    paths[1].unlink()
+    assert prune_cache(cache_dir) == 1
+    assert len(list(cache_dir.iterdir())) == 2
+    # and the least recently used ones beyond the size limit
+    assert prune_cache(cache_dir, max_bytes=1.5 * entry_size) == 1
+    (entry,) = cache_dir.iterdir()
+    assert str(paths[2].resolve()) in (entry / "meta.json").read_text()
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+from pandas import read_parquet
+
+import cellanneal.general as general
+import cellanneal.pipelines as pipelines
+from cellanneal import cellanneal_pipe
+from cellanneal.loader import ChunkedDataFile
+
+from conftest import make_data
+
+
+def run_pipe(tmp_path, celltype_df, bulk_df, **kwargs):
+    return cellanneal_pipe(
+        tmp_path / "signature.csv",
+        celltype_df,
+        tmp_path / "mixture.csv",
+        bulk_df,
+        0.0,
+        0.0,
+        1.0,
+        2,
+        tmp_path,
+        **kwargs
+    )
+
+
+def test_resume_keeps_dtype(tmp_path, monkeypatch):
+    celltype_df, bulk_df = make_data()
+
+    # interrupt the run after its first sample
+    deconvolve_sample = general._deconvolve_sample
+    count = [0]
+
+    def interrupted(*args, **kwargs):
+        count[0] += 1
+        if count[0] > 1:
+            raise KeyboardInterrupt
+        return deconvolve_sample(*args, **kwargs)
+
+    monkeypatch.setattr(general, "_deconvolve_sample", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        run_pipe(tmp_path, celltype_df, bulk_df, dtype="float32")
+    monkeypatch.setattr(general, "_deconvolve_sample", deconvolve_sample)
+
+    # record the precision of the data the remaining samples are annealed in
+    deconvolve = pipelines.deconvolve
+    dtypes = []
+
+    def recording(*args, **kwargs):
+        result = deconvolve(*args, **kwargs)
+        dtypes.append(result.alignment.signature.dtype)
+        dtypes.append(result.alignment.bulk.dtype)
+        return result
+
+    monkeypatch.setattr(pipelines, "deconvolve", recording)
+    run_folder = next(tmp_path.glob("cellanneal_*"))
+    run_pipe(tmp_path, celltype_df, bulk_df, dtype="float32", resume_path=run_folder)
+
+    assert dtypes == [np.float32, np.float32]
+    results = (
+        run_folder / "deconvolution_results" / "deconvolution_mixture.csv"
+    ).read_text()
+    assert len(results.splitlines()) == len(bulk_df.columns) + 1
+
+
+def test_genewise_file_with_failed_chunk(tmp_path):
+    pytest.importorskip("pyarrow")
+    celltype_df, bulk_df = make_data()
+    # the genes of the last two samples are not expressed in the signature,
+    # so that the second chunk consists of failed samples only
+    bulk_df.iloc[:, 2:] = 0.0
+    bulk_df.iloc[:3, 2:] = 1.0
+    celltype_df.iloc[:3] = 0.0
+
+    mixture_path = tmp_path / "mixture.csv"
+    bulk_df.to_csv(mixture_path)
+    chunked = ChunkedDataFile(mixture_path, 2)
+    run_pipe(tmp_path, celltype_df, chunked, genewise_format="parquet")
+
+    run_folder = next(tmp_path.glob("cellanneal_*"))
+    genewise = read_parquet(
+        run_folder / "genewise_comparison" / "expression_mixture.parquet"
+    )
+    assert set(genewise["sample"]) == {"sample0", "sample1"}
+    finished = (run_folder / pipelines.CHECKPOINT_FILE).read_text().splitlines()
+    assert len(finished) == len(bulk_df.columns)
+
+
+def test_chunks_after_run_time_limit(tmp_path):
+    celltype_df, bulk_df = make_data()
+    mixture_path = tmp_path / "mixture.csv"
+    bulk_df.to_csv(mixture_path)
+    chunked = ChunkedDataFile(mixture_path, 2)
+    # the run time is used up before the chunks are deconvolved
+    run_pipe(tmp_path, celltype_df, chunked, run_time_limit=1e-9)
+
+    run_folder = next(tmp_path.glob("cellanneal_*"))
+    finished = (run_folder / pipelines.CHECKPOINT_FILE).read_text().splitlines()
+    assert len(finished) == len(bulk_df.columns)
+
+
+def test_npz_genewise_file_not_streamed(tmp_path, capsys):
+    celltype_df, bulk_df = make_data()
+    mixture_path = tmp_path / "mixture.csv"
+    bulk_df.to_csv(mixture_path)
+    chunked = ChunkedDataFile(mixture_path, 2)
+    assert run_pipe(tmp_path, celltype_df, chunked, genewise_format="npz") == 0
+    assert "npz" in capsys.readouterr().out
+    assert not list(tmp_path.glob("cellanneal_*"))
+
+
+def test_npz_genewise_file(tmp_path):
+    celltype_df, bulk_df = make_data()
+    run_pipe(tmp_path, celltype_df, bulk_df, genewise_format="npz")
+
+    run_folder = next(tmp_path.glob("cellanneal_*"))
+    genewise = np.load(run_folder / "genewise_comparison" / "expression_mixture.npz")
+    assert set(genewise["sample"]) == set(bulk_df.columns)